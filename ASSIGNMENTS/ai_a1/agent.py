@@ -2,15 +2,234 @@
 # 22I-0813
 # Section E
 
+# agent files: "Agent 1: [((33, 357), (33, 358), ...)] at times [1, 0, ...]"
+# the whole file is parsed at once with numpy (numbers are read in one go,
+# newline and " at times " positions split them into agents), so big files
+# don't go through a python loop per line.
+# read_agents gives the old dict of lists, read_agent_schedules a compact
+# AgentSchedules that can be cached in a binary file next to the text
+
+import os
+import re
+import struct
+import numpy as np
+from cache import cache_is_fresh, write_cache_file
+
+# header of the binary schedule file: magic, agents, entries
+SCHEDULE_HEADER = struct.Struct('<4sII')
+SCHEDULE_MAGIC = b'AGSC'
+
+# byte translation keeping digits and minus signs, everything else a space
+NUMBERS_ONLY = bytes(c if chr(c) in '0123456789-' else ord(' ') for c in range(256))
+
+
+def _ranges(starts, lengths):
+    """Concatenation of range(start, start + length) for every pair."""
+    total = int(lengths.sum())
+    offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return offsets + np.arange(total, dtype=np.int64)
+
+
+def _parse_agent_file(file_path):
+    """Raw contents of an agent file, in file order.
+
+    Returns (path_lengths, coords, time_counts, times): agent k has
+    path_lengths[k] cells whose rows and columns interleave in its slice of
+    coords, and time_counts[k] entries in its slice of times.
+    """
+    with open(file_path, 'rb') as file:
+        text = file.read()
+    data = np.frombuffer(text, dtype=np.uint8)
+
+    # numbers: blank out everything else and let numpy's text reader
+    # convert them; where each run of digits starts splits them into lines
+    digit = np.zeros(len(data) + 2, dtype=bool)
+    digit[1:-1] = (data - ord('0')) < 10
+    starts = np.flatnonzero(digit[1:] != digit[:-1])[0::2]
+    values = np.fromstring(text.translate(NUMBERS_ONLY), dtype=np.int64, sep=' ') \
+        if len(starts) else np.zeros(0, dtype=np.int64)
+    if len(values) != len(starts):
+        raise ValueError(f'{file_path} is not an agent file')
+
+    newlines = np.flatnonzero(data == ord('\n'))
+    # per line counts from where each newline falls in the sorted positions
+    def per_line_count(positions):
+        return np.diff(np.searchsorted(positions, newlines), prepend=0, append=len(positions))
+
+    per_line = per_line_count(starts)
+    # " at times " splits a line into the path and the times, however the
+    # cells are bracketed ("[((a, b), ...)]" or "[(a, b), ...]")
+    markers = np.array([match.start() for match in re.finditer(b' at times ', text)], dtype=np.int64)
+    # blank lines carry no numbers, every other line has one marker
+    used = per_line > 0
+    bad = np.flatnonzero(per_line_count(markers) != used)
+    if len(bad):
+        raise ValueError(f'{file_path}: line {int(bad[0]) + 1} is not an agent line')
+    line_starts = (np.cumsum(per_line) - per_line)[used]
+    per_line = per_line[used]
+
+    # a line is: agent number, two per cell, then the times
+    before = np.searchsorted(starts, markers) - line_starts
+    path_lengths = (before - 1) // 2
+    time_counts = per_line - before
+    bad = np.flatnonzero((before % 2 == 0) | (path_lengths < 1) | (time_counts < 1))
+    if len(bad):
+        line = int(np.flatnonzero(used)[bad[0]]) + 1
+        raise ValueError(f'{file_path}: line {line} is not an agent line')
+
+    coords = values[_ranges(line_starts + 1, 2 * path_lengths)]
+    times = values[_ranges(line_starts + 1 + 2 * path_lengths, time_counts)]
+    return path_lengths, coords, time_counts, times
+
 
 def read_agents(file_path):
+    path_lengths, coords, time_counts, times = _parse_agent_file(file_path)
+    coords, times = coords.tolist(), times.tolist()
     agents = {}
-    with open(file_path, 'r') as file:
-        for line in file:
-            path_str, times_str = line.strip().split(' at times ')
-            path = [tuple(map(int, pos.strip('()').split(','))) for pos in path_str.split(': ')[1].strip('[]').split('), (')]
-            times = list(map(int, times_str.strip('[]').split(', ')))
-            agent_id = len(agents) + 1
-            agents[agent_id] = {'path': path, 'times': times}
+    cell = time = 0
+    for agent_id, (length, count) in enumerate(zip(path_lengths.tolist(), time_counts.tolist()), 1):
+        end = cell + 2 * length
+        path = list(zip(coords[cell:end:2], coords[cell + 1:end:2]))
+        agents[agent_id] = {'path': path, 'times': times[time:time + count]}
+        cell, time = end, time + count
     return agents
 
+
+class AgentSchedules:
+    """Every agent's cycle in a few flat arrays, ordered by time.
+
+    Agent a (0-based, agent id a + 1) repeats every period[a] steps. Its
+    entries are offsets[a]:offsets[a + 1]: phase holds the times mod period
+    in ascending order and cells the (row, col) it is on then. For the usual
+    agent whose times are a shuffle of 0..period-1 the phases are exactly
+    0..period-1, so its cell at time t is cells[offsets[a] + t % period[a]].
+    """
+
+    def __init__(self, period, offsets, phase, cells):
+        self.period = period
+        self.offsets = offsets
+        self.phase = phase
+        self.cells = cells
+        counts = np.diff(offsets)
+        owner = np.repeat(np.arange(len(period)), counts)
+        # dense: one entry for every phase, so no search is needed
+        gaps = np.bincount(owner[phase != np.arange(len(phase)) - offsets[owner]], minlength=len(period))
+        self.dense = (counts == period) & (gaps == 0)
+        self._owner = owner
+
+    @classmethod
+    def from_lists(cls, path_lengths, coords, time_counts, times):
+        """Build from _parse_agent_file output (file order)."""
+        # path[i] goes with times[i], extra cells or times have no partner
+        pairs = np.minimum(path_lengths, time_counts)
+        owner = np.repeat(np.arange(len(pairs)), pairs)
+        cell_index = _ranges(np.cumsum(path_lengths) - path_lengths, pairs)
+        phase = times[_ranges(np.cumsum(time_counts) - time_counts, pairs)]
+        cells = coords.reshape(-1, 2)[cell_index]
+        period = time_counts
+
+        # a time outside 0..period-1 never matches time_step % period
+        keep = (phase >= 0) & (phase < period[owner])
+        owner, phase, cells = owner[keep], phase[keep], cells[keep]
+        order = np.lexsort((phase, owner))
+        offsets = np.zeros(len(period) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(owner, minlength=len(period)))
+        return cls(period.astype(np.int32), offsets, phase[order].astype(np.int32),
+                   cells[order].astype(np.int32))
+
+    def __len__(self):
+        return len(self.period)
+
+    def position_at(self, agent, time_step):
+        """Cell agent (0-based) blocks at time_step, or None."""
+        start = self.offsets[agent]
+        phase = time_step % int(self.period[agent])
+        if self.dense[agent]:
+            index = start + phase
+        else:
+            end = self.offsets[agent + 1]
+            index = start + np.searchsorted(self.phase[start:end], phase)
+            if index == end or self.phase[index] != phase:
+                return None
+        return tuple(self.cells[index].tolist())
+
+    def blocked_at(self, time_step):
+        """(k, 2) array of every cell some agent blocks at time_step."""
+        dense = np.flatnonzero(self.dense)
+        picked = self.offsets[dense] + time_step % self.period[dense]
+        if len(dense) < len(self.period):
+            # agents with gaps or repeated times: check their entries
+            sparse = ~self.dense[self._owner]
+            entries = np.flatnonzero(sparse)
+            hit = self.phase[entries] == time_step % self.period[self._owner[entries]]
+            picked = np.concatenate((picked, entries[hit]))
+        return self.cells[picked]
+
+    def to_table(self):
+        """(row, col, period, phase) rows, what AgentOccupancy.from_array takes."""
+        return np.column_stack((self.cells, self.period[self._owner], self.phase)).astype(np.int32).reshape(-1, 4)
+
+    def to_agents(self):
+        """read_agents style dict, one path cell per entry."""
+        cells, phase = self.cells.tolist(), self.phase.tolist()
+        offsets, periods, dense = self.offsets.tolist(), self.period.tolist(), self.dense.tolist()
+        agents = {}
+        for a in range(len(self)):
+            path = [tuple(cell) for cell in cells[offsets[a]:offsets[a + 1]]]
+            times = phase[offsets[a]:offsets[a + 1]]
+            if not dense[a]:
+                # keep the period of agents with gaps: pad with a time that never matches
+                padding = periods[a] - len(times)
+                path += [path[0] if path else (-1, -1)] * padding
+                times += [-1] * padding
+            agents[a + 1] = {'path': path, 'times': times}
+        return agents
+
+
+def save_agent_schedules(schedules, file_path):
+    with open(file_path, 'wb') as file:
+        file.write(SCHEDULE_HEADER.pack(SCHEDULE_MAGIC, len(schedules), len(schedules.phase)))
+        for array in (schedules.period, schedules.offsets, schedules.phase, schedules.cells):
+            file.write(np.ascontiguousarray(array).tobytes())
+
+
+def load_agent_schedules(file_path, mmap=True):
+    """Load schedules written by save_agent_schedules, memory-mapped by default."""
+    with open(file_path, 'rb') as file:
+        magic, count, entries = SCHEDULE_HEADER.unpack(file.read(SCHEDULE_HEADER.size))
+    if magic != SCHEDULE_MAGIC:
+        raise ValueError(f'{file_path} is not an agent schedule file')
+    layout = ((np.int32, (count,)), (np.int64, (count + 1,)), (np.int32, (entries,)), (np.int32, (entries, 2)))
+    if mmap:
+        data = np.memmap(file_path, dtype=np.uint8, mode='r', offset=SCHEDULE_HEADER.size)
+    else:
+        with open(file_path, 'rb') as file:
+            file.seek(SCHEDULE_HEADER.size)
+            data = np.frombuffer(file.read(), dtype=np.uint8)
+    arrays = []
+    position = 0
+    for dtype, shape in layout:
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        arrays.append(data[position:position + size].view(dtype).reshape(shape))
+        position += size
+    return AgentSchedules(*arrays)
+
+
+def agent_cache_path(file_path):
+    return os.path.splitext(file_path)[0] + '.agsc'
+
+
+def read_agent_schedules(file_path, cache=False):
+    """AgentSchedules of an AgentN.txt file.
+
+    With cache=True they are saved next to the text as AgentN.agsc and
+    later calls memory-map that instead, for as long as it is newer.
+    """
+    cache_file = agent_cache_path(file_path)
+    if cache and cache_is_fresh(cache_file, file_path):
+        return load_agent_schedules(cache_file)
+
+    schedules = AgentSchedules.from_lists(*_parse_agent_file(file_path))
+    if cache:
+        write_cache_file(save_agent_schedules, schedules, cache_file)
+    return schedules
@@ -0,0 +1,181 @@
+# Hassan Imrman
+# 22I-0813
+# Section E
+
+# headless batch runner
+# runs every dataN/AgentN/RobotsN triple in Data/ and OldData/ with no
+# terminal output and prints one JSON summary (ticks, collisions, search
+# expansions, wall time per scenario), optionally several scenarios at once
+#
+#   python batch.py                      all scenarios, one after another
+#   python batch.py Data --jobs 4        Data/ only, four processes
+#   python batch.py --output runs.json   write the summary to a file
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import random
+import time
+from grid import AgentOccupancy, read_terrain_costs
+from robot import Robot
+from pathfinding import MoveModel, merge_stats
+from main import load_scenario, plan_initial, simulate, run_fleet
+from replay import ReplayWriter
+
+FOLDERS = ('Data', 'OldData')
+
+
+def find_scenarios(folders=FOLDERS):
+    """(folder, index) of every complete, non-empty triple in folders."""
+    scenarios = []
+    for folder in folders:
+        index = 0
+        while os.path.exists(os.path.join(folder, f'data{index}.txt')):
+            files = [os.path.join(folder, f'{name}{index}.txt') for name in ('data', 'Agent', 'Robots')]
+            if all(os.path.exists(file) and os.path.getsize(file) > 0 for file in files):
+                scenarios.append((folder, index))
+            index += 1
+    return scenarios
+
+
+def run_scenario(scenario, planning='independent', window=None, vectorized=False, max_ticks=100000, per_tick=False,
+                 cache=False, seed=None, replay_dir=None, connectivity=4, wait=False, terrain=False, cbs_options=None):
+    """Plan and simulate one scenario silently and return its summary.
+
+    seed seeds the robots' random choices; with replay_dir the run is also
+    logged there as <folder>_<index>.rpl. connectivity, wait and terrain
+    (costs from digits in the map) pick the robots' MoveModel. cbs_options
+    go to cbs_search, whose stats (solved or not) end up under 'cbs'.
+    """
+    folder, index = scenario
+    started = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        grid_height, grid_width, static_obstacles, agents, robot_data = load_scenario(folder, index, cache)
+        occupancy = AgentOccupancy(agents)
+        rng = None if seed is None else random.Random(seed)
+        costs = read_terrain_costs(os.path.join(folder, f'data{index}.txt')) if terrain else None
+        moves = MoveModel(connectivity, wait, costs)
+        moves = None if moves.is_plain() else moves
+        robots = [Robot(data['start'], data['goal'], static_obstacles, grid_width, grid_height, agents, rng=rng,
+                        moves=moves, occupancy=occupancy)
+                  for data in robot_data]
+        for robot in robots:
+            robot.stats = {}
+        loaded = time.perf_counter()
+
+        cbs = plan_initial(robots, grid_height, grid_width, static_obstacles, agents, occupancy, planning, window,
+                           cbs_options)
+        planned = time.perf_counter()
+
+        planning_stats = {}
+        for robot in robots:
+            merge_stats(planning_stats, robot.stats)
+
+        tick_stats = []
+        loop = run_fleet if vectorized else simulate
+        replay = None
+        if replay_dir is not None:
+            replay = os.path.join(replay_dir, f'{os.path.basename(os.path.normpath(folder))}_{index}.rpl')
+            writer = ReplayWriter(replay, grid_height, grid_width, len(robots))
+        else:
+            writer = contextlib.nullcontext()
+        with writer:
+            ticks = loop(robots, grid_height, grid_width, static_obstacles, agents, occupancy, planning, window,
+                         verbose=False, max_ticks=max_ticks, tick_stats=tick_stats, replay=writer if replay else None)
+    finished = time.perf_counter()
+
+    search = {}
+    for robot in robots:
+        merge_stats(search, robot.stats)
+
+    summary = {
+        'scenario': os.path.join(folder, f'data{index}.txt'),
+        'grid': [grid_height, grid_width],
+        'robots': len(robots),
+        'agents': len(agents),
+        'ticks': ticks,
+        'finished': all(robot.is_done() for robot in robots),
+        'reached_goal': sum(robot.current == robot.goal for robot in robots),
+        'no_path': sum(robot.noPath for robot in robots),
+        'collisions': sum(robot.collision_count for robot in robots),
+        'expansions': search.get('expanded', 0),
+        'search': search,
+        'initial_planning_search': planning_stats,
+        'load_time': loaded - started,
+        'plan_time': planned - loaded,
+        'wall_time': finished - started,
+    }
+    if cbs is not None:
+        summary['cbs'] = cbs
+    if replay:
+        summary['replay'] = replay
+    if per_tick:
+        # only ticks where something was planned
+        summary['ticks_search'] = [dict(stats, tick=tick) for tick, stats in enumerate(tick_stats) if stats]
+    return summary
+
+
+def _run(job):
+    scenario, options = job
+    return run_scenario(scenario, **options)
+
+
+def run_batch(scenarios, jobs=1, **options):
+    """run_scenario over scenarios, on `jobs` processes when jobs > 1."""
+    if jobs > 1 and options.get('planning') == 'parallel':
+        raise ValueError("planning='parallel' already uses a process pool, run it with jobs=1")
+    work = [(scenario, options) for scenario in scenarios]
+    if jobs > 1 and len(work) > 1:
+        with multiprocessing.Pool(min(jobs, len(work))) as pool:
+            return pool.map(_run, work, chunksize=1)
+    return [_run(job) for job in work]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run every scenario headless and print a JSON summary.')
+    parser.add_argument('folders', nargs='*', default=list(FOLDERS))
+    parser.add_argument('--jobs', type=int, default=1, help='scenarios run at the same time')
+    parser.add_argument('--planning', default='independent',
+                        choices=['independent', 'cooperative', 'parallel', 'cbs', 'rolling'])
+    parser.add_argument('--window', type=int, default=None,
+                        help='WHCA* window for cooperative planning, steps planned ahead for rolling')
+    parser.add_argument('--vectorized', action='store_true', help='run the tick loop on a numpy Fleet')
+    parser.add_argument('--max-ticks', type=int, default=100000)
+    parser.add_argument('--per-tick', action='store_true', help='include search stats for every tick that planned')
+    parser.add_argument('--cache', action='store_true', help='keep parsed maps and agents as binary files next to the text')
+    parser.add_argument('--connectivity', type=int, default=4, choices=[4, 8], help='8 adds diagonal moves')
+    parser.add_argument('--wait', action='store_true', help='let robots wait in place')
+    parser.add_argument('--terrain', action='store_true', help='digits 1-9 in the maps are cell costs')
+    parser.add_argument('--seed', type=int, default=None, help='seed for the robots\' random choices')
+    parser.add_argument('--replay-dir', help='log every run to a replay file in this folder')
+    parser.add_argument('--suboptimality', type=float, default=1.0, help='CBS focal bound, 1 is optimal')
+    parser.add_argument('--max-nodes', type=int, default=10000, help='CBS high level nodes before giving up')
+    parser.add_argument('--time-limit', type=float, default=None, help='CBS seconds before giving up')
+    parser.add_argument('--output', help='write the JSON here instead of stdout')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    results = run_batch(find_scenarios(args.folders), args.jobs, planning=args.planning, window=args.window,
+                        vectorized=args.vectorized, max_ticks=args.max_ticks, per_tick=args.per_tick,
+                        cache=args.cache, seed=args.seed, replay_dir=args.replay_dir,
+                        connectivity=args.connectivity, wait=args.wait, terrain=args.terrain,
+                        cbs_options={'suboptimality': args.suboptimality, 'max_nodes': args.max_nodes,
+                                     'time_limit': args.time_limit})
+    summary = {
+        'planning': args.planning,
+        'vectorized': args.vectorized,
+        'jobs': args.jobs,
+        'scenarios': results,
+        'total_wall_time': time.perf_counter() - started,
+    }
+    if args.planning == 'cbs':
+        # a CBS run stopped by --max-nodes/--time-limit still runs, on paths that collide
+        summary['cbs_unsolved'] = [result['scenario'] for result in results if not result['cbs']['solved']]
+    text = json.dumps(summary, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
@@ -0,0 +1,230 @@
+# Hassan Imrman
+# 22I-0813
+# Section E
+
+# benchmarks for the pathfinding stack
+# times map loading, is_cell_free and the planners on the shipped maps and on
+# random synthetic grids, and prints one JSON document so runs can be
+# compared over time
+#
+#   python benchmark.py                                  shipped maps + 100..4000 grids
+#   python benchmark.py --sizes 100 500 --density 0.3 --agents 500
+#   python benchmark.py --no-shipped --planner array --output bench.json
+
+import argparse
+import contextlib
+import glob
+import json
+import os
+import resource
+import shutil
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from grid import read_and_initialize_obstacles, is_cell_free, AgentOccupancy, component_labels
+from agent import read_agents
+from robot import PLANNERS
+
+SIZES = (100, 250, 500, 1000, 2000, 4000)
+
+
+def write_map(file_path, blocked):
+    """Write a boolean array in the dataN.txt format (height, then 'X'/' ' rows)."""
+    rows = np.where(blocked, ord('X'), ord(' ')).astype(np.uint8)
+    with open(file_path, 'wb') as file:
+        file.write(f'{blocked.shape[0]}\n'.encode())
+        for row in rows:
+            file.write(row.tobytes() + b'\n')
+
+
+def random_agents(blocked, count, rng):
+    """Agents like the shipped ones: short random walks with shuffled times."""
+    grid_height, grid_width = blocked.shape
+    free = np.flatnonzero(~blocked.reshape(-1))
+    agents = {}
+    if not len(free):
+        return agents
+    for agent_id in range(1, count + 1):
+        cell = int(free[rng.integers(len(free))])
+        x, y = divmod(cell, grid_width)
+        path = [(x, y)]
+        for _ in range(int(rng.integers(3, 8))):
+            dx, dy = ((0, 1), (1, 0), (0, -1), (-1, 0))[rng.integers(4)]
+            if 0 <= x + dx < grid_height and 0 <= y + dy < grid_width and not blocked[x + dx, y + dy]:
+                x, y = x + dx, y + dy
+            path.append((x, y))
+        agents[agent_id] = {'path': path, 'times': rng.permutation(len(path)).tolist()}
+    return agents
+
+
+def random_queries(static_obstacles, grid_height, grid_width, count, distance, rng):
+    """Start/goal pairs in the same component, at most `distance` apart per axis."""
+    labels = component_labels(static_obstacles, grid_height, grid_width)
+    free = np.flatnonzero(labels >= 0)
+    queries = []
+    for _ in range(count * 20):
+        if len(queries) == count or not len(free):
+            break
+        start = int(free[rng.integers(len(free))])
+        x, y = divmod(start, grid_width)
+        gx = int(np.clip(x + rng.integers(-distance, distance + 1), 0, grid_height - 1))
+        gy = int(np.clip(y + rng.integers(-distance, distance + 1), 0, grid_width - 1))
+        if labels[gx * grid_width + gy] == labels[start] and (gx, gy) != (x, y):
+            queries.append(((x, y), (gx, gy)))
+    return queries
+
+
+def percentiles(samples):
+    if not samples:
+        return None
+    values = np.array(samples) * 1000
+    return {'p50': float(np.percentile(values, 50)), 'p90': float(np.percentile(values, 90)),
+            'p99': float(np.percentile(values, 99)), 'max': float(values.max())}
+
+
+def peak_memory(function):
+    """Run function under tracemalloc and return (result, peak MB)."""
+    tracemalloc.start()
+    try:
+        result = function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, peak / 1e6
+
+
+def bench_load(map_file, repeat=3):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        read_and_initialize_obstacles(map_file)
+        times.append(time.perf_counter() - started)
+    _, peak = peak_memory(lambda: read_and_initialize_obstacles(map_file))
+
+    # same again from the binary cache, written on a scratch copy so the
+    # shipped folders stay clean
+    with tempfile.TemporaryDirectory() as folder:
+        copy = os.path.join(folder, os.path.basename(map_file))
+        shutil.copyfile(map_file, copy)
+        read_and_initialize_obstacles(copy, cache=True)
+        cached = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            read_and_initialize_obstacles(copy, cache=True)
+            cached.append(time.perf_counter() - started)
+    return {'seconds': min(times), 'cached_seconds': min(cached), 'bytes': os.path.getsize(map_file),
+            'peak_mb': peak}
+
+
+def bench_is_cell_free(grid_height, grid_width, static_obstacles, agents, occupancy, rng, calls=200000):
+    cells = list(zip(rng.integers(0, grid_height, calls).tolist(), rng.integers(0, grid_width, calls).tolist()))
+    steps = rng.integers(0, 1000, calls).tolist()
+    started = time.perf_counter()
+    for cell, time_step in zip(cells, steps):
+        is_cell_free(cell, time_step, static_obstacles, agents, occupancy)
+    elapsed = time.perf_counter() - started
+    return {'calls': calls, 'calls_per_s': calls / elapsed, 'ns_per_call': elapsed / calls * 1e9}
+
+
+def bench_search(queries, grid_height, grid_width, static_obstacles, agents, occupancy, planner, horizon,
+                 memory_queries=3):
+    search = PLANNERS[planner]
+    latencies = []
+    expanded = 0
+    found = 0
+    for start, goal in queries:
+        stats = {}
+        started = time.perf_counter()
+        path, _ = search(start, goal, grid_height, grid_width, static_obstacles, agents, 0, occupancy, horizon,
+                         stats=stats)
+        latencies.append(time.perf_counter() - started)
+        expanded += stats.get('expanded', 0)
+        found += path is not None
+
+    # peak memory per query on a few of them, tracemalloc slows things down
+    peak = 0.0
+    for start, goal in queries[:memory_queries]:
+        _, query_peak = peak_memory(lambda: search(start, goal, grid_height, grid_width, static_obstacles, agents,
+                                                   0, occupancy, horizon))
+        peak = max(peak, query_peak)
+
+    total = sum(latencies)
+    return {'planner': planner, 'queries': len(queries), 'found': found, 'expanded': expanded,
+            'nodes_per_s': expanded / total if total else None, 'latency_ms': percentiles(latencies),
+            'peak_mb': peak}
+
+
+def run_case(name, map_file, agents, options, rng):
+    grid_height, grid_width, static_obstacles = read_and_initialize_obstacles(map_file)
+    occupancy = AgentOccupancy(agents)
+    queries = random_queries(static_obstacles, grid_height, grid_width, options.queries, options.distance, rng)
+    horizon = options.horizon or 20 * options.distance
+
+    # the searches print when they fail; keep the JSON clean
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        search = bench_search(queries, grid_height, grid_width, static_obstacles, agents, occupancy,
+                              options.planner, horizon)
+    return {
+        'name': name,
+        'grid': [grid_height, grid_width],
+        'obstacles': len(static_obstacles),
+        'agents': len(agents),
+        'load': bench_load(map_file),
+        'is_cell_free': bench_is_cell_free(grid_height, grid_width, static_obstacles, agents, occupancy, rng,
+                                           options.cell_calls),
+        'search': search,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark map loading, is_cell_free and path search.')
+    parser.add_argument('--sizes', type=int, nargs='*', default=list(SIZES), help='synthetic grid sides')
+    parser.add_argument('--density', type=float, default=0.2, help='obstacle fraction of synthetic grids')
+    parser.add_argument('--agents', type=int, default=100, help='agents on synthetic grids')
+    parser.add_argument('--queries', type=int, default=20, help='searches per map')
+    parser.add_argument('--distance', type=int, default=100, help='max start/goal offset per axis')
+    parser.add_argument('--horizon', type=int, default=None, help='search horizon (default 20 * distance)')
+    parser.add_argument('--planner', default='astar', choices=sorted(PLANNERS))
+    parser.add_argument('--cell-calls', type=int, default=200000, help='is_cell_free calls per map')
+    parser.add_argument('--no-shipped', action='store_true', help='skip the maps in Data/ and OldData/')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the JSON here instead of stdout')
+    options = parser.parse_args()
+
+    rng = np.random.default_rng(options.seed)
+    results = []
+    started = time.perf_counter()
+
+    if not options.no_shipped:
+        for map_file in sorted(glob.glob('Data/data*.txt') + glob.glob('OldData/data*.txt')):
+            agent_file = os.path.join(os.path.dirname(map_file), 'Agent' + os.path.basename(map_file)[4:])
+            if os.path.getsize(map_file) == 0:
+                continue
+            agents = read_agents(agent_file) if os.path.exists(agent_file) else {}
+            results.append(run_case(map_file, map_file, agents, options, rng))
+
+    with tempfile.TemporaryDirectory() as folder:
+        for size in options.sizes:
+            blocked = rng.random((size, size)) < options.density
+            map_file = os.path.join(folder, f'random{size}.txt')
+            write_map(map_file, blocked)
+            agents = random_agents(blocked, options.agents, rng)
+            results.append(run_case(f'random {size}x{size} density {options.density}', map_file, agents, options, rng))
+
+    summary = {
+        'config': vars(options),
+        'results': results,
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'total_seconds': time.perf_counter() - started,
+    }
+    text = json.dumps(summary, indent=2)
+    if options.output:
+        with open(options.output, 'w') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
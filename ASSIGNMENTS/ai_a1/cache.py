@@ -0,0 +1,60 @@
+# Hassan Imrman
+# 22I-0813
+# Section E
+
+# caches of things worked out from a map
+# MapCache keeps the last few results in memory (distance tables, jump
+# tables, cluster graphs). the binary cache files kept next to the text they
+# were parsed from (dataN.obsg, AgentN.agsc, dataN.hpa) are written to a
+# temporary name and renamed into place, so a parallel run never
+# memory-maps a half written file, and a read-only data folder just means
+# no caching
+
+import os
+from collections import OrderedDict
+
+
+class MapCache:
+    """LRU of values built from a map, keyed by the map object and a key.
+
+    The map is keyed by id() and a reference to it is kept with the value,
+    so its id can't be reused by another map while the entry is cached.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+
+    def get(self, static_obstacles, key, build):
+        """The cached value for (static_obstacles, key), or build() stored as it."""
+        key = (id(static_obstacles), key)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            return entry[1]
+        value = build()
+        self.entries[key] = (static_obstacles, value)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+        return value
+
+
+def cache_is_fresh(cache_file, source):
+    """True if cache_file exists and is at least as new as source."""
+    return os.path.exists(cache_file) and os.path.getmtime(cache_file) >= os.path.getmtime(source)
+
+
+def write_cache_file(save, value, cache_file):
+    """save(value, path) to a temporary file, then rename it to cache_file.
+
+    Returns False (and leaves nothing behind) if the folder can't be written.
+    """
+    partial = f'{cache_file}.{os.getpid()}'
+    try:
+        save(value, partial)
+        os.replace(partial, cache_file)
+        return True
+    except OSError:
+        if os.path.exists(partial):
+            os.remove(partial)
+        return False
@@ -0,0 +1,250 @@
+# Hassan Imrman
+# 22I-0813
+# Section E
+
+# Conflict-Based Search (Sharon et al.) for the whole robot fleet
+# the high level searches a tree of constraint sets: plan every robot on its
+# own, find the first pair that collides, and split into two children that
+# each forbid one of the two robots that cell (or that move) at that time.
+# with a suboptimality bound w > 1 the high level runs a focal search: among
+# the nodes costing at most w times the cheapest one it expands the node with
+# the fewest conflicts, which usually finds a plan after far fewer nodes
+
+import os
+import sys
+import time
+from heapq import heappush, heappop
+from grid import AgentOccupancy, read_and_initialize_obstacles
+from agent import read_agents
+from robot import Robot, PLANNERS, read_robots
+from cooperative import ReservationTable
+
+# low level planners that plan around a ReservationTable (jps and hpa hand
+# it to a_star_search_array); sipp takes none, and rolling would return a
+# window of the path as if it were the whole of it
+LOW_LEVEL_PLANNERS = ('astar', 'array', 'jps', 'hpa')
+
+
+class CBSNode:
+    """One set of constraints and the paths planned under it."""
+
+    def __init__(self, constraints, paths, cost):
+        # robot index -> tuple of constraints, shared with the parent node
+        # (cell, None, time) is a vertex constraint,
+        # (from, to, time) forbids that move arriving at time
+        self.constraints = constraints
+        self.paths = paths
+        self.cost = cost
+        self.conflicts, self.conflict = find_conflicts(paths)
+
+
+def find_conflicts(paths):
+    """Count conflicts between paths and return (count, first conflict).
+
+    path[k] is the robot's cell k steps after planning started and robots
+    stay on their last cell afterwards. The first conflict is (i, j, cell,
+    other, k): robots i and j both on cell at step k when other is None,
+    otherwise i moving cell -> other while j moves other -> cell.
+    """
+    count = 0
+    first = None
+    steps = max((len(path) for path in paths), default=0)
+    for k in range(1, steps):
+        seen = {}
+        moves = {}
+        for i, path in enumerate(paths):
+            cell = path[k] if k < len(path) else path[-1]
+            prev = path[k - 1] if k - 1 < len(path) else path[-1]
+            other = seen.get(cell)
+            if other is None:
+                seen[cell] = i
+            else:
+                count += 1
+                if first is None:
+                    first = (other, i, cell, None, k)
+            if prev != cell:
+                # someone moving the other way through the same edge
+                other = moves.get((cell, prev))
+                if other is not None:
+                    count += 1
+                    if first is None:
+                        first = (other, i, cell, prev, k)
+                moves[(prev, cell)] = i
+    return count, first
+
+
+def cbs_search(robots, grid_height, grid_width, static_obstacles, agents, current_time=0, occupancy=None,
+               suboptimality=1.0, planner='array', max_nodes=10000, time_limit=None, horizon=None):
+    """Collision free paths for all robots, optimal or within `suboptimality`.
+
+    The cost of a node is the sum of the robots' travel times. Robots get
+    their path when a conflict free node is found; otherwise (node or time
+    limit) they get the paths of the best node seen so far. horizon caps
+    every low level search like in a_star_search.
+    Returns a dict of statistics: solved, cost, conflicts, expanded and
+    generated high level nodes, low level searches and wall time.
+    """
+    if planner not in LOW_LEVEL_PLANNERS:
+        raise ValueError(f'planner {planner} can not be the low level of cbs, use one of {LOW_LEVEL_PLANNERS}')
+    started = time.perf_counter()
+    if occupancy is None:
+        occupancy = AgentOccupancy(agents)
+    search = PLANNERS[planner]
+    stats = {'solved': False, 'cost': None, 'conflicts': None, 'expanded': 0, 'generated': 0,
+             'low_level': 0, 'time': 0.0}
+
+    # robots that can't reach their goal at all never move, everyone else
+    # has to plan around them
+    fixed = set()
+
+    def low_level(index, constraints):
+        robot = robots[index]
+        table = ReservationTable()
+        for other in fixed:
+            table.parked[robots[other].current] = (current_time, other)
+        for cell, next_pos, time_step in constraints:
+            if next_pos is None:
+                table.forbid(cell, time_step, index)
+            else:
+                table.forbid_move(cell, next_pos, time_step, index)
+        distances = robot.goal_table(grid_height, grid_width, static_obstacles)
+        stats['low_level'] += 1
+        # the robot's own counters, like plan_path fills them
+        search_stats = None if robot.stats is None else {}
+        path, _ = search(robot.current, robot.goal, grid_height, grid_width, static_obstacles, agents,
+                         current_time, occupancy, horizon, distances, reservations=table, stats=search_stats)
+        if search_stats is not None:
+            robot.add_stats(search_stats)
+        return path
+
+    # root: everyone on their own, repeated while robots turn out to be stuck
+    paths = [None] * len(robots)
+    pending = [i for i, robot in enumerate(robots) if not robot.is_done()]
+    for i, robot in enumerate(robots):
+        if robot.is_done():
+            fixed.add(i)
+    while pending:
+        stuck = []
+        for i in pending:
+            paths[i] = low_level(i, ())
+            if paths[i] is None:
+                stuck.append(i)
+        fixed.update(stuck)
+        # only paths running through a stuck robot have to be redone
+        blocked = {robots[i].current for i in stuck}
+        pending = [i for i in pending if i not in fixed and blocked.intersection(paths[i])]
+    for i in fixed:
+        paths[i] = [robots[i].current]
+
+    def cost_of(paths):
+        return sum(len(path) - 1 for path in paths)
+
+    root = CBSNode({}, paths, cost_of(paths))
+    stats['generated'] = 1
+
+    # open: every node by cost; focal: nodes within the bound by conflicts;
+    # waiting: open nodes not yet in focal. the cheapest cost never goes
+    # down (children cost at least their parent), so neither does the bound
+    counter = 0
+    open_set = [(root.cost, counter, root)]
+    waiting = []
+    focal = [(root.conflicts, root.cost, counter, root)]
+    expanded = set()
+    best = root
+
+    def push(node):
+        nonlocal counter
+        counter += 1
+        heappush(open_set, (node.cost, counter, node))
+        if node.cost <= bound:
+            heappush(focal, (node.conflicts, node.cost, counter, node))
+        else:
+            heappush(waiting, (node.cost, counter, node))
+
+    bound = root.cost * suboptimality
+    while focal:
+        if stats['expanded'] >= max_nodes or (time_limit is not None and time.perf_counter() - started > time_limit):
+            break
+
+        node_id, node = focal[0][2], focal[0][3]
+        heappop(focal)
+        expanded.add(node_id)
+        stats['expanded'] += 1
+        if node.conflicts < best.conflicts or (node.conflicts == best.conflicts and node.cost < best.cost):
+            best = node
+
+        if node.conflict is None:
+            best = node
+            stats['solved'] = True
+            break
+
+        first, second, cell, next_pos, step = node.conflict
+        time_step = current_time + step
+        children = ((first, (cell, next_pos, time_step)),
+                    (second, (cell if next_pos is None else next_pos,
+                              None if next_pos is None else cell, time_step)))
+        for index, constraint in children:
+            # a stuck robot can't dodge, only the other one can
+            if index in fixed:
+                continue
+            constraints = dict(node.constraints)
+            constraints[index] = constraints.get(index, ()) + (constraint,)
+            path = low_level(index, constraints[index])
+            if path is None:
+                continue
+            paths = list(node.paths)
+            paths[index] = path
+            push(CBSNode(constraints, paths, node.cost - len(node.paths[index]) + len(path)))
+            stats['generated'] += 1
+
+        # drop expanded nodes from the top of open and raise the bound
+        while open_set and open_set[0][1] in expanded:
+            heappop(open_set)
+        if open_set:
+            bound = max(bound, open_set[0][0] * suboptimality)
+        while waiting and waiting[0][0] <= bound:
+            cost, node_id, node = heappop(waiting)
+            heappush(focal, (node.conflicts, cost, node_id, node))
+
+    for i, robot in enumerate(robots):
+        if i in fixed and not robot.is_done():
+            robot.path = []
+            robot.noPath = True
+        elif i not in fixed:
+            robot.path = best.paths[i][1:]
+            robot.total_time = current_time + len(best.paths[i]) - 1
+
+    stats['cost'] = best.cost
+    stats['conflicts'] = best.conflicts
+    stats['time'] = time.perf_counter() - started
+    return stats
+
+
+def report_instances(folder='Data', suboptimality=1.0, planner='array', max_nodes=10000, time_limit=60):
+    """Run cbs_search on every data/Agent/Robots triple in folder and print the stats."""
+    results = {}
+    for index in range(10):
+        map_file = os.path.join(folder, f'data{index}.txt')
+        if not os.path.exists(map_file) or os.path.getsize(map_file) == 0:
+            continue
+        grid_height, grid_width, static_obstacles = read_and_initialize_obstacles(map_file)
+        agents = read_agents(os.path.join(folder, f'Agent{index}.txt'))
+        robot_data = read_robots(os.path.join(folder, f'Robots{index}.txt'))
+        occupancy = AgentOccupancy(agents)
+        robots = [Robot(data['start'], data['goal'], static_obstacles, grid_width, grid_height, agents,
+                        occupancy=occupancy)
+                  for data in robot_data]
+
+        stats = cbs_search(robots, grid_height, grid_width, static_obstacles, agents, 0, occupancy,
+                           suboptimality, planner, max_nodes, time_limit)
+        results[map_file] = stats
+        print(f"{map_file}: {len(robots)} robots, solved {stats['solved']}, cost {stats['cost']}, "
+              f"conflicts {stats['conflicts']}, nodes {stats['expanded']} expanded / {stats['generated']} generated, "
+              f"{stats['low_level']} low level searches, {stats['time']:.2f}s")
+    return results
+
+
+if __name__ == "__main__":
+    # python cbs.py [folder] [suboptimality]
+    report_instances(sys.argv[1] if len(sys.argv) > 1 else 'Data',
+                     float(sys.argv[2]) if len(sys.argv) > 2 else 1.0)
@@ -3,6 +3,7 @@
 # Section E
 
 import random
+import numpy as np
 
 def detect_robot_collisions(robots):
     """Detect if any robots occupy the same cell."""
@@ -18,7 +19,72 @@ def detect_robot_collisions(robots):
     # all the list where more than one robot is present agaist a key
     return [robots for robots in positions.values() if len(robots) > 1]
 
-def get_random_direction():
-    """Return a random direction for robot movement."""
+class CollisionIndex:
+    """Spatial hash of robot positions, kept up to date as robots move.
+
+    Building it hooks the robots in; from then on Robot.move and
+    handle_collision report every position change, so a tick costs one
+    dict update per moving robot. Cells with more than one robot and
+    swaps between two robots are noted as the moves come in, and
+    detect() only reads those notes instead of rebuilding anything.
+    """
+
+    def __init__(self, robots):
+        self.cells = {}        # cell -> set of robot indices on it
+        self.crowded = set()   # cells holding more than one robot
+        self.moves = {}        # (from, to) -> robot indices, this tick only
+        self.swaps = []        # (robot, robot) pairs that swapped this tick
+        for index, robot in enumerate(robots):
+            robot.collision_index = self
+            robot.collision_slot = index
+            self._add(index, robot.current)
+
+    def _add(self, index, cell):
+        robots = self.cells.get(cell)
+        if robots is None:
+            self.cells[cell] = {index}
+        else:
+            robots.add(index)
+            self.crowded.add(cell)
+
+    def _remove(self, index, cell):
+        robots = self.cells[cell]
+        robots.discard(index)
+        if len(robots) < 2:
+            self.crowded.discard(cell)
+            if not robots:
+                del self.cells[cell]
+
+    def update(self, index, old, new, moving=True):
+        """Robot index went from old to new; moving=False for shoves (no edge)."""
+        if old == new:
+            return
+        self._remove(index, old)
+        self._add(index, new)
+        if moving:
+            for other in self.moves.get((new, old), ()):
+                self.swaps.append((other, index))
+            self.moves.setdefault((old, new), []).append(index)
+
+    def detect(self):
+        """Conflicts since the last call, as index arrays.
+
+        Returns (vertex, swaps): vertex holds the robots sharing a cell,
+        grouped by cell, and swaps is a (k, 2) array of robots that passed
+        through each other. Starts a new tick.
+        """
+        vertex = [index for cell in sorted(self.crowded) for index in sorted(self.cells[cell])]
+        swaps = np.array(self.swaps, dtype=np.int64).reshape(-1, 2)
+        self.moves = {}
+        self.swaps = []
+        return np.array(vertex, dtype=np.int64), swaps
+
+
+def get_random_direction(rng=None):
+    """Return a random direction for robot movement.
+
+    rng is a random.Random to draw from (the robot's, so seeded runs repeat);
+    the global random module when None.
+    """
     directions = [(0, 1), (1, 0), (0, -1), (-1, 0)]  # right, down, left, up
-    return random.choice(directions)
\ No newline at end of file
+    return (random if rng is None else rng).choice(directions)
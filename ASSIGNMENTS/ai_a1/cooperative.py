@@ -0,0 +1,113 @@
+# Hassan Imrman
+# 22I-0813
+# Section E
+
+# Cooperative A* (and its windowed version WHCA*)
+# robots are planned one after the other; every planned robot reserves the
+# (cell, time) pairs it uses and later robots plan around those reservations,
+# so most collisions never happen instead of being shoved apart afterwards
+
+
+class ReservationTable:
+    """Space-time cells and moves already claimed by planned robots.
+
+    With window_end set (WHCA*) reservations after that time are ignored;
+    robots replan before they get there.
+    """
+
+    def __init__(self, window_end=None):
+        self.cells = {}      # (cell, time) -> robot
+        self.edges = {}      # (from, to, arrival time) -> robot
+        self.parked = {}     # cell -> (time, robot): robot stays there from then on
+        self.last_use = {}   # cell -> last time anyone passes through it
+        self.window_end = window_end
+        # after this time only parked robots are left, so the world is
+        # periodic again and the planners can fold time by the agent period
+        self.settle_time = -1
+
+    def reserve_path(self, path, start_time, owner, park=True):
+        """Claim path[k] at start_time + k; park on the last cell if asked.
+
+        With a window only the part up to window_end is claimed, and a path
+        cut short there doesn't park: its last cell is just where the robot
+        is when the window ends, not where it stays.
+        """
+        if self.window_end is not None:
+            reserved = path[:max(0, self.window_end - start_time) + 1]
+            park = park and len(reserved) == len(path)
+            path = reserved
+        for k, cell in enumerate(path):
+            time_step = start_time + k
+            self.cells[(cell, time_step)] = owner
+            self.last_use[cell] = max(self.last_use.get(cell, -1), time_step)
+            if k:
+                self.edges[(path[k - 1], cell, time_step)] = owner
+        if path:
+            self.settle_time = max(self.settle_time, start_time + len(path) - 1)
+            if park:
+                self.parked[path[-1]] = (start_time + len(path) - 1, owner)
+
+    def forbid(self, cell, time_step, owner=None):
+        """Vertex constraint: nobody planning against this table is on cell at time_step."""
+        self.cells[(cell, time_step)] = owner
+        self.last_use[cell] = max(self.last_use.get(cell, -1), time_step)
+        self.settle_time = max(self.settle_time, time_step)
+
+    def forbid_move(self, current, next_pos, time_step, owner=None):
+        """Edge constraint: no move current -> next_pos arriving at time_step."""
+        # can_move looks moves up backwards (it's checking for swaps)
+        self.edges[(next_pos, current, time_step)] = owner
+        self.settle_time = max(self.settle_time, time_step)
+
+    def can_move(self, current, next_pos, next_time):
+        """False if someone else is on next_pos then, or is swapping with us."""
+        if self.window_end is not None and next_time > self.window_end:
+            return not self._parked_by(next_pos, next_time)
+        if (next_pos, next_time) in self.cells:
+            return False
+        if (next_pos, current, next_time) in self.edges:
+            return False
+        return not self._parked_by(next_pos, next_time)
+
+    def can_park(self, cell, time_step):
+        """True if a robot reaching cell at time_step may stay there for good."""
+        if cell in self.parked:
+            return False
+        last = self.last_use.get(cell, -1)
+        if self.window_end is not None:
+            last = min(last, self.window_end)
+        return last < time_step
+
+    def _parked_by(self, cell, time_step):
+        parked = self.parked.get(cell)
+        return parked is not None and parked[0] <= time_step
+
+
+def plan_cooperative(robots, grid_height, grid_width, static_obstacles, agents, current_time, occupancy=None,
+                     window=None, planner='array'):
+    """Plan robots in order, each one respecting the reservations of the ones before.
+
+    Returns the ReservationTable. With window set only the first `window`
+    steps of each path are reserved (WHCA*) and searched: rolling_search
+    plans that far around the reservations and scores the rest with the
+    static goal distance, so a replan costs the window, not the trip. Call
+    again every few ticks, before the planned steps run out.
+    """
+    window_end = None if window is None else current_time + window
+    reservations = ReservationTable(window_end)
+
+    # robots that are already done (or stuck) sit where they are
+    for index, robot in enumerate(robots):
+        if robot.is_done():
+            reservations.reserve_path([robot.current], current_time, index)
+
+    for index, robot in enumerate(robots):
+        if robot.is_done():
+            continue
+        robot.path = []
+        robot.plan_path(grid_height, grid_width, static_obstacles, agents, current_time, occupancy,
+                        horizon=window, planner=planner if window is None else 'rolling',
+                        reservations=reservations)
+        # a robot that found no path never moves again, so it parks where it is
+        reservations.reserve_path([robot.current] + list(robot.path), current_time, index)
+    return reservations
@@ -0,0 +1,149 @@
+# Hassan Imrman
+# 22I-0813
+# Section E
+
+# the whole fleet as a structure of arrays
+# positions, goals and done flags are numpy arrays and every robot's path is
+# a slice of one shared step buffer with a cursor into it, so a tick (move
+# everyone, check goals, find collisions) is a handful of array operations
+# instead of a python loop over Robot objects
+
+import numpy as np
+
+# cells are packed into one int64 key as row * 2**32 + col, which stays
+# unique for robots shoved off the map (negative coordinates)
+KEY_SHIFT = 1 << 32
+
+
+def cell_keys(positions):
+    return positions[:, 0] * KEY_SHIFT + positions[:, 1]
+
+
+class Fleet:
+    """Positions, goals, paths and done flags of n robots in numpy arrays.
+
+    Robot i's remaining path is steps[cursor[i]:end[i]]. Replanned paths are
+    appended to the step buffer, which is compacted when it fills up.
+    Use to_robot/from_robot to hand a single robot to Robot methods (e.g.
+    handle_collision) and back.
+    """
+
+    def __init__(self, robots):
+        n = len(robots)
+        self.size = n
+        self.pos = np.array([robot.current for robot in robots], dtype=np.int64).reshape(n, 2)
+        self.goal = np.array([robot.goal for robot in robots], dtype=np.int64).reshape(n, 2)
+        self.no_path = np.array([robot.noPath for robot in robots], dtype=bool)
+        self.cursor = np.zeros(n, dtype=np.int64)
+        self.end = np.zeros(n, dtype=np.int64)
+        # cursor at the last to_robot, so save_path only gets the new steps
+        self.synced = np.zeros(n, dtype=np.int64)
+        self.steps = np.zeros((max(16, sum(len(robot.path) for robot in robots)), 2), dtype=np.int64)
+        self.used = 0
+        # who moved in the last step() and where they came from
+        self.moved = np.zeros(0, dtype=np.int64)
+        self.prev = np.zeros((0, 2), dtype=np.int64)
+        for index, robot in enumerate(robots):
+            self.set_path(index, robot.path)
+        self.done = self.no_path | ((self.pos == self.goal).all(axis=1) & (self.cursor >= self.end))
+
+    def set_path(self, index, path):
+        """Replace robot index's remaining path (a list of cells)."""
+        count = len(path)
+        if self.used + count > len(self.steps):
+            self._make_room(count)
+        if count:
+            self.steps[self.used:self.used + count] = path
+        self.cursor[index] = self.synced[index] = self.used
+        self.end[index] = self.used + count
+        self.used += count
+
+    def _make_room(self, count):
+        # drop the parts of the buffer nobody points at any more (steps
+        # already written back to save_path), and grow if that isn't enough
+        kept = self.end - self.synced
+        live = int(kept.sum())
+        capacity = len(self.steps)
+        while live + count > capacity // 2:
+            capacity *= 2
+        steps = np.zeros((capacity, 2), dtype=np.int64)
+        starts = np.cumsum(kept) - kept
+        for index in np.flatnonzero(kept).tolist():
+            start, length = self.synced[index], kept[index]
+            steps[starts[index]:starts[index] + length] = self.steps[start:start + length]
+        self.steps = steps
+        self.cursor = starts + (self.cursor - self.synced)
+        self.end = starts + kept
+        self.synced = starts
+        self.used = live
+
+    def step(self):
+        """Move every robot that isn't done one step; returns their indices."""
+        active = np.flatnonzero(~self.done & (self.cursor < self.end))
+        self.prev = self.pos[active]
+        self.pos[active] = self.steps[self.cursor[active]]
+        self.cursor[active] += 1
+        # at the goal with steps left is just passing through
+        self.done[active] = (self.pos[active] == self.goal[active]).all(axis=1) & (self.cursor[active] >= self.end[active])
+        self.moved = active
+        return active
+
+    def detect(self):
+        """Conflicts after the last step(), same arrays as CollisionIndex.detect.
+
+        vertex: robots sharing a cell, grouped by cell; swaps: (k, 2) pairs
+        of robots that moved through each other.
+        """
+        keys = cell_keys(self.pos)
+        order = np.argsort(keys, kind='stable')
+        ordered = keys[order]
+        same = ordered[1:] == ordered[:-1]
+        shared = np.zeros(len(keys), dtype=bool)
+        shared[1:] |= same
+        shared[:-1] |= same
+        vertex = order[shared]
+        return vertex, self._swaps()
+
+    def _swaps(self):
+        moved = self.moved
+        if not len(moved):
+            return np.zeros((0, 2), dtype=np.int64)
+        before, after = cell_keys(self.prev), cell_keys(self.pos[moved])
+        real = before != after
+        moved, before, after = moved[real], before[real], after[real]
+        delta = self.pos[moved] - self.prev[real]
+        # an undirected edge is its lower cell plus the step to the other
+        # end; two robots on the same edge in opposite directions swapped
+        forward = before < after
+        delta[~forward] *= -1
+        edges = np.minimum(before, after) * 16 + (delta + 1) @ np.array([3, 1])
+
+        order = np.argsort(edges, kind='stable')
+        ordered = edges[order]
+        starts = np.flatnonzero(np.concatenate(([True], ordered[1:] != ordered[:-1])))
+        sizes = np.diff(np.append(starts, len(ordered)))
+        pairs = []
+        for start, size in zip(starts[sizes > 1].tolist(), sizes[sizes > 1].tolist()):
+            group = order[start:start + size]
+            ahead = moved[group[forward[group]]].tolist()
+            back = moved[group[~forward[group]]].tolist()
+            pairs.extend((min(i, j), max(i, j)) for i in ahead for j in back)
+        return np.array(sorted(pairs), dtype=np.int64).reshape(-1, 2)
+
+    def all_done(self):
+        return bool(self.done.all())
+
+    def to_robot(self, index, robot):
+        """Write robot index's state back onto its Robot object."""
+        robot.current = tuple(self.pos[index].tolist())
+        robot.path = [tuple(cell) for cell in self.steps[self.cursor[index]:self.end[index]].tolist()]
+        robot.save_path.extend(tuple(cell) for cell in self.steps[self.synced[index]:self.cursor[index]].tolist())
+        robot.noPath = bool(self.no_path[index])
+        self.synced[index] = self.cursor[index]
+
+    def from_robot(self, index, robot):
+        """Take position, path and noPath from a Robot after it changed them."""
+        self.pos[index] = robot.current
+        self.no_path[index] = robot.noPath
+        self.set_path(index, robot.path)
+        self.done[index] = robot.is_done()
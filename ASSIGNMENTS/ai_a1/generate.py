@@ -0,0 +1,243 @@
+# Hassan Imrman
+# 22I-0813
+# Section E
+
+# scenario generator for load tests
+# writes dataN.txt, AgentN.txt and RobotsN.txt in the same formats as the
+# shipped ones, so load_scenario, batch.py and main.py read them as they are.
+# everything comes from one numpy generator, the same seed gives the same
+# files byte for byte. maps, agent walks and robot picks are built with
+# array operations, so 5000x5000 grids with 100k agents and 10k robots take
+# seconds (most of it labelling the map's connected areas)
+#
+#   python generate.py Generated                          one 1000x1000 scenario, index 0
+#   python generate.py Generated --size 5000 --agents 100000 --robots 10000 --index 1
+#   python generate.py Generated --cluster 8 --terrain 0.3 --trip 200 --seed 7
+
+import argparse
+import json
+import os
+import time
+import numpy as np
+from grid import label_components
+
+# agents write this many lines at a time
+AGENT_CHUNK = 10000
+
+
+def random_map(grid_height, grid_width, density, rng, cluster=1):
+    """(height, width) boolean obstacle array, about `density` of it blocked.
+
+    cluster > 1 decides blocks of cluster x cluster cells at a time, which
+    gives walls and open areas instead of salt and pepper noise.
+    """
+    rows, cols = -(-grid_height // cluster), -(-grid_width // cluster)
+    # 16 bit draws: a 5000x5000 map in 50MB instead of 200MB of floats
+    blocked = rng.integers(0, 1 << 16, (rows, cols), dtype=np.uint16) < int(density * (1 << 16))
+    if cluster > 1:
+        blocked = np.repeat(np.repeat(blocked, cluster, axis=0), cluster, axis=1)[:grid_height, :grid_width]
+    return np.ascontiguousarray(blocked)
+
+
+def random_terrain(blocked, fraction, rng):
+    """Cell costs for read_terrain_costs: `fraction` of the free cells cost 2-9, the rest 1."""
+    costs = np.ones(blocked.shape, dtype=np.uint8)
+    if fraction > 0:
+        rough = (rng.integers(0, 1 << 16, blocked.shape, dtype=np.uint16) < int(fraction * (1 << 16))) & ~blocked
+        costs[rough] = rng.integers(2, 10, int(rough.sum()), dtype=np.uint8)
+    return costs
+
+
+def write_map(file_path, blocked, costs=None):
+    """Height, then one 'X'/' ' row per line; cells costing more than 1 get their digit."""
+    grid_height, grid_width = blocked.shape
+    text = np.full((grid_height, grid_width + 1), ord('\n'), dtype=np.uint8)
+    text[:, :grid_width] = np.where(blocked, ord('X'), ord(' '))
+    if costs is not None:
+        rough = (costs > 1) & ~blocked
+        text[:, :grid_width][rough] = costs[rough] + ord('0')
+    with open(file_path, 'wb') as file:
+        file.write(f'{grid_height}\n'.encode())
+        file.write(text.tobytes())
+
+
+def random_free_cells(blocked, count, rng, allowed=None):
+    """count random (row, col) cells that are free (and allowed, a boolean mask), repeats possible."""
+    grid_height, grid_width = blocked.shape
+    ok = ~blocked if allowed is None else allowed & ~blocked
+    if not ok.any():
+        raise ValueError('no free cell to place anything on')
+    cells = np.zeros((0, 2), dtype=np.int64)
+    # rejection sampling: no (cells,) index array of every free cell needed
+    while len(cells) < count:
+        need = count - len(cells)
+        draw = np.column_stack((rng.integers(0, grid_height, 2 * need + 16), rng.integers(0, grid_width, 2 * need + 16)))
+        cells = np.concatenate((cells, draw[ok[draw[:, 0], draw[:, 1]]]))
+    return cells[:count]
+
+
+def random_agents(blocked, count, rng, steps=(3, 8)):
+    """Patrols like the shipped agents: random walks with shuffled times.
+
+    Returns (lengths, paths, times): agent a walks paths[a, :lengths[a]] and
+    is on paths[a, i] when t % lengths[a] == times[a, i]. A walk takes
+    `steps` (low, high inclusive) random moves, staying put when one would
+    leave the map or hit a wall.
+    """
+    grid_height, grid_width = blocked.shape
+    low, high = steps
+    lengths = rng.integers(low, high + 1, count) + 1
+    longest = int(lengths.max()) if count else 1
+    paths = np.zeros((count, longest, 2), dtype=np.int64)
+    paths[:, 0] = random_free_cells(blocked, count, rng) if count else paths[:, 0]
+    directions = np.array([(0, 1), (1, 0), (0, -1), (-1, 0)])
+    for step in range(1, longest):
+        here = paths[:, step - 1]
+        there = here + directions[rng.integers(0, 4, count)]
+        inside = ((there[:, 0] >= 0) & (there[:, 0] < grid_height) & (there[:, 1] >= 0) & (there[:, 1] < grid_width))
+        moves = inside.copy()
+        moves[inside] = ~blocked[there[inside, 0], there[inside, 1]]
+        paths[:, step] = np.where(moves[:, None], there, here)
+    # a random permutation of 0..length-1 per agent: sort random keys, the
+    # padding past each agent's length sorts last
+    keys = rng.random((count, longest))
+    keys[np.arange(longest) >= lengths[:, None]] = 2.0
+    times = np.argsort(keys, axis=1)
+    return lengths, paths, times
+
+
+def write_agents(file_path, lengths, paths, times):
+    """'Agent 1: [((r, c), ...)] at times [..]' lines, like read_agents expects."""
+    with open(file_path, 'w') as file:
+        for first in range(0, len(lengths), AGENT_CHUNK):
+            lines = []
+            block = zip(lengths[first:first + AGENT_CHUNK].tolist(), paths[first:first + AGENT_CHUNK].tolist(),
+                        times[first:first + AGENT_CHUNK].tolist())
+            for agent_id, (length, path, order) in enumerate(block, first + 1):
+                cells = ', '.join(f'({x}, {y})' for x, y in path[:length])
+                lines.append(f'Agent {agent_id}: [({cells})] at times {order[:length]}\n')
+            file.write(''.join(lines))
+
+
+def random_robots(blocked, count, rng, agent_cells=None, trip=None, labels=None):
+    """(starts, goals) of count robots, (count, 2) arrays each.
+
+    Starts are all different, and so are goals (robots parked on the same
+    goal would keep colliding); neither is on a cell an agent ever uses, and
+    every start can reach its goal. With trip set a goal is at most `trip`
+    rows and columns away from its start.
+    """
+    grid_height, grid_width = blocked.shape
+    if labels is None:
+        labels = label_components(blocked)
+    allowed = ~blocked
+    if agent_cells is not None and len(agent_cells):
+        allowed[agent_cells[:, 0], agent_cells[:, 1]] = False
+    if allowed.sum() < 2 * count:
+        raise ValueError(f'only {int(allowed.sum())} free cells for {count} robots')
+
+    # everything happens in the biggest connected area
+    sizes = np.bincount(labels[allowed])
+    main_area = int(sizes.argmax())
+    allowed &= labels == main_area
+    if allowed.sum() < 2 * count:
+        raise ValueError(f'the biggest open area only has {int(allowed.sum())} free cells for {count} robots')
+
+    def distinct(cells, taken):
+        # first use of each cell, in draw order, that isn't taken yet
+        keys = cells[:, 0] * grid_width + cells[:, 1]
+        _, first = np.unique(keys, return_index=True)
+        keep = np.zeros(len(keys), dtype=bool)
+        keep[first] = True
+        return keep & ~np.isin(keys, taken)
+
+    starts = np.zeros((0, 2), dtype=np.int64)
+    while len(starts) < count:
+        more = random_free_cells(blocked, count - len(starts), rng, allowed)
+        starts = np.concatenate((starts, more))
+        starts = starts[distinct(starts, [])]
+    start_keys = starts[:, 0] * grid_width + starts[:, 1]
+
+    goals = np.full((count, 2), -1, dtype=np.int64)
+    missing = np.arange(count)
+    for _ in range(1000):
+        if not len(missing):
+            break
+        if trip is None:
+            picks = random_free_cells(blocked, len(missing), rng, allowed)
+        else:
+            offsets = rng.integers(-trip, trip + 1, (len(missing), 2))
+            picks = np.clip(starts[missing] + offsets, 0, [grid_height - 1, grid_width - 1])
+        good = allowed[picks[:, 0], picks[:, 1]]
+        taken = np.concatenate((start_keys, goals[goals[:, 0] >= 0, 0] * grid_width + goals[goals[:, 0] >= 0, 1]))
+        good &= distinct(picks, taken)
+        goals[missing[good]] = picks[good]
+        missing = missing[~good]
+    if len(missing):
+        raise ValueError(f'could not place goals for {len(missing)} robots, try a bigger trip')
+    return starts, goals
+
+
+def write_robots(file_path, starts, goals):
+    """'Robot 1: Start (x, y) End (x, y)' lines, like read_robots expects."""
+    with open(file_path, 'w') as file:
+        file.write(''.join(f'Robot {robot_id}: Start ({sx}, {sy}) End ({gx}, {gy})\n'
+                           for robot_id, ((sx, sy), (gx, gy)) in enumerate(zip(starts.tolist(), goals.tolist()), 1)))
+
+
+def generate(folder, index=0, grid_height=1000, grid_width=1000, density=0.2, agents=100, robots=10, seed=0,
+             cluster=1, terrain=0.0, agent_steps=(3, 8), trip=None):
+    """Write folder/dataN.txt, AgentN.txt and RobotsN.txt and return what was made and how long it took."""
+    rng = np.random.default_rng(seed)
+    os.makedirs(folder, exist_ok=True)
+    timings = {}
+    started = time.perf_counter()
+
+    blocked = random_map(grid_height, grid_width, density, rng, cluster)
+    costs = random_terrain(blocked, terrain, rng) if terrain else None
+    map_file = os.path.join(folder, f'data{index}.txt')
+    write_map(map_file, blocked, costs)
+    timings['map_seconds'] = time.perf_counter() - started
+
+    clock = time.perf_counter()
+    lengths, paths, times = random_agents(blocked, agents, rng, agent_steps)
+    write_agents(os.path.join(folder, f'Agent{index}.txt'), lengths, paths, times)
+    timings['agent_seconds'] = time.perf_counter() - clock
+
+    clock = time.perf_counter()
+    used = paths[np.arange(paths.shape[1]) < lengths[:, None]] if agents else None
+    starts, goals = random_robots(blocked, robots, rng, used, trip)
+    write_robots(os.path.join(folder, f'Robots{index}.txt'), starts, goals)
+    timings['robot_seconds'] = time.perf_counter() - clock
+
+    return dict({
+        'map': map_file,
+        'grid': [grid_height, grid_width],
+        'blocked': float(blocked.mean()),
+        'agents': agents,
+        'agent_entries': int(lengths.sum()),
+        'robots': robots,
+        'seed': seed,
+        'total_seconds': time.perf_counter() - started,
+    }, **timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Write a random dataN/AgentN/RobotsN scenario.')
+    parser.add_argument('folder')
+    parser.add_argument('--index', type=int, default=0, help='N in the file names')
+    parser.add_argument('--size', type=int, nargs='+', default=[1000], help='side, or height and width')
+    parser.add_argument('--density', type=float, default=0.2, help='obstacle fraction')
+    parser.add_argument('--cluster', type=int, default=1, help='obstacles in blocks of this side')
+    parser.add_argument('--terrain', type=float, default=0.0, help='fraction of free cells costing 2-9')
+    parser.add_argument('--agents', type=int, default=100)
+    parser.add_argument('--agent-steps', type=int, nargs=2, default=[3, 8], help='moves per patrol, low high')
+    parser.add_argument('--robots', type=int, default=10)
+    parser.add_argument('--trip', type=int, default=None, help='max rows/columns between a start and its goal')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    grid_height, grid_width = (args.size * 2)[:2]
+    summary = generate(args.folder, args.index, grid_height, grid_width, args.density, args.agents, args.robots,
+                       args.seed, args.cluster, args.terrain, tuple(args.agent_steps), args.trip)
+    print(json.dumps(summary, indent=2))
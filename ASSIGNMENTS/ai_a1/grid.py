@@ -2,28 +2,447 @@
 # 22I-0813
 # Section E
 
-def read_and_initialize_obstacles(file_path):
-    with open(file_path, 'r') as file:
-        lines = file.readlines()
-        grid_height = int(lines[0].strip())
-        
-        static_obstacles = set()
-        for i, line in enumerate(lines[1:grid_height + 1]):
-            for j, cell in enumerate(line.rstrip('\n')):
-                if cell == 'X':
-                    static_obstacles.add((i, j))
-        
-        grid_width = max(len(line.rstrip('\n')) for line in lines[1:grid_height + 1])
-    
-    return grid_height, grid_width, static_obstacles
-
-
-def is_cell_free(cell, time_step, static_obstacles, agents):
+import math
+import os
+import struct
+import sys
+import timeit
+import numpy as np
+from cache import MapCache, cache_is_fresh, write_cache_file
+
+# header of the binary obstacle file: magic, height, width
+OBSTACLE_HEADER = struct.Struct('<4sII')
+OBSTACLE_MAGIC = b'OBSG'
+
+
+class ObstacleGrid:
+    """Static obstacles packed one bit per cell.
+
+    Rows are packed with np.packbits so a 1000x1000 map takes ~125KB instead
+    of a set of hundreds of thousands of tuples. `cell in grid` works like it
+    did with the old set, so is_cell_free and friends don't need to change.
+    """
+
+    def __init__(self, bits, grid_height, grid_width):
+        self.bits = bits
+        self.height = grid_height
+        self.width = grid_width
+        self.row_bytes = bits.shape[1] if grid_height else 0
+        # memoryview indexing is a lot cheaper than numpy scalar indexing
+        self._cells = memoryview(np.ascontiguousarray(bits).reshape(-1))
+        self._flat = None
+        self._labels = None
+        # map file this grid was read from when caching is on, cache files
+        # for it (e.g. the hpa cluster graph) go next to it
+        self.source = None
+
+    @classmethod
+    def from_array(cls, blocked):
+        blocked = np.asarray(blocked, dtype=bool)
+        return cls(np.packbits(blocked, axis=1), blocked.shape[0], blocked.shape[1])
+
+    def __contains__(self, cell):
+        i, j = cell
+        # out of bounds is never an obstacle, same as the old set
+        if 0 <= i < self.height and 0 <= j < self.width:
+            return self._cells[i * self.row_bytes + (j >> 3)] & (128 >> (j & 7)) != 0
+        return False
+
+    def __len__(self):
+        return int(np.unpackbits(self.bits, axis=1, count=self.width).sum()) if self.height else 0
+
+    def __iter__(self):
+        rows, cols = np.nonzero(self.to_array())
+        return zip(rows.tolist(), cols.tolist())
+
+    def to_array(self):
+        """Unpacked (height, width) boolean array, True where there is an 'X'."""
+        if not self.height:
+            return np.zeros((0, self.width), dtype=bool)
+        return np.unpackbits(self.bits, axis=1, count=self.width).view(bool)
+
+    def nbytes(self):
+        return self.bits.nbytes
+
+    def flat_mask(self):
+        """One byte per cell (1 = obstacle), row-major. Built once and kept."""
+        if self._flat is None:
+            self._flat = self.to_array().reshape(-1).view(np.uint8).tobytes()
+        return self._flat
+
+
+def save_obstacle_grid(grid, file_path):
+    with open(file_path, 'wb') as file:
+        file.write(OBSTACLE_HEADER.pack(OBSTACLE_MAGIC, grid.height, grid.width))
+        file.write(np.ascontiguousarray(grid.bits).tobytes())
+
+
+def load_obstacle_grid(file_path, mmap=True):
+    """Load a grid written by save_obstacle_grid, memory-mapped by default."""
+    with open(file_path, 'rb') as file:
+        magic, grid_height, grid_width = OBSTACLE_HEADER.unpack(file.read(OBSTACLE_HEADER.size))
+    if magic != OBSTACLE_MAGIC:
+        raise ValueError(f'{file_path} is not an obstacle grid file')
+    row_bytes = (grid_width + 7) // 8
+    if mmap and grid_height and row_bytes:
+        bits = np.memmap(file_path, dtype=np.uint8, mode='r', offset=OBSTACLE_HEADER.size,
+                         shape=(grid_height, row_bytes))
+    else:
+        with open(file_path, 'rb') as file:
+            file.seek(OBSTACLE_HEADER.size)
+            data = file.read(grid_height * row_bytes)
+        bits = np.frombuffer(data, dtype=np.uint8).reshape(grid_height, row_bytes)
+    return ObstacleGrid(bits, grid_height, grid_width)
+
+
+def _map_layout(data):
+    """(height, width, row starts, row ends, row lengths) of a memory-mapped map file."""
+    newlines = np.flatnonzero(data == ord('\n'))
+    header_end = int(newlines[0]) if len(newlines) else len(data)
+    grid_height = int(bytes(data[:header_end]).strip())
+
+    # row k runs from ends[k - 1] + 1 to ends[k], the last one may have no newline
+    ends = newlines[1:grid_height + 1]
+    if len(ends) < grid_height and len(newlines) and newlines[-1] + 1 < len(data):
+        ends = np.append(ends, len(data))
+    starts = np.concatenate(([header_end + 1], ends[:-1] + 1)) if len(ends) else ends
+    lengths = ends - starts
+    # \r\n files read the same as \n ones, like open() in text mode
+    lengths -= (lengths > 0) & (data[np.maximum(ends - 1, 0)] == ord('\r'))
+    grid_width = int(lengths.max()) if len(lengths) else 0
+    return grid_height, grid_width, starts, ends, lengths
+
+
+def _map_cells(data, layout, wanted):
+    """Where `wanted` (byte array -> bool array) holds in the map, as (rows, cols) plus the rows view.
+
+    The rows view is the strided (height, width) view of a rectangular map,
+    None otherwise (then rows and cols list the matching cells).
+    """
+    grid_height, grid_width, starts, ends, lengths = layout
+    stride = int(starts[1] - starts[0]) if len(starts) > 1 else 0
+    if len(ends) == grid_height > 1 and (lengths == grid_width).all() and (np.diff(starts) == stride).all():
+        # the usual rectangular map: the rows are a strided view of the file
+        return None, None, np.lib.stride_tricks.as_strided(data[starts[0]:], (grid_height, grid_width), (stride, 1))
+    if not len(ends):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), None
+    first = int(starts[0])
+    body = data[first:ends[-1]]
+    cells = np.flatnonzero(wanted(body)) + first
+    rows = np.searchsorted(ends, cells)
+    cols = cells - starts[rows]
+    # a stray \r at the end of a row isn't a cell
+    inside = cols < lengths[rows]
+    return rows[inside], cols[inside], None
+
+
+def parse_obstacle_file(file_path):
+    """(height, width, boolean array) of a map file, parsed in one go.
+
+    The file is memory-mapped and handled as one byte array: newline
+    positions give the row starts and lengths, and every 'X' is placed with
+    a searchsorted over them, so there is no python loop over lines.
+    """
+    if os.path.getsize(file_path) == 0:
+        raise ValueError(f'{file_path} is empty')
+    data = np.memmap(file_path, dtype=np.uint8, mode='r')
+    layout = _map_layout(data)
+    grid_height, grid_width = layout[:2]
+
+    blocked = np.zeros((grid_height, grid_width), dtype=bool)
+    rows, cols, view = _map_cells(data, layout, lambda body: body == ord('X'))
+    if view is not None:
+        np.equal(view, ord('X'), out=blocked)
+    else:
+        blocked[rows, cols] = True
+    del data, view
+    return grid_height, grid_width, blocked
+
+
+def read_terrain_costs(file_path):
+    """(height, width) uint8 array of what entering each cell costs.
+
+    Maps may mark free cells with a digit 1-9 instead of a space; that digit
+    is the cell's cost, every other cell costs 1. The obstacle parser reads
+    digits as free cells, so terrain maps load everywhere else unchanged.
+    """
+    if os.path.getsize(file_path) == 0:
+        raise ValueError(f'{file_path} is empty')
+    data = np.memmap(file_path, dtype=np.uint8, mode='r')
+    layout = _map_layout(data)
+    grid_height, grid_width = layout[:2]
+
+    def digit(body):
+        return (body - ord('1')) < 9
+
+    costs = np.ones((grid_height, grid_width), dtype=np.uint8)
+    rows, cols, view = _map_cells(data, layout, digit)
+    if view is not None:
+        marked = digit(view)
+        costs[marked] = view[marked] - ord('0')
+    else:
+        costs[rows, cols] = data[layout[2][rows] + cols] - ord('0')
+    del data, view
+    return costs
+
+
+def obstacle_cache_path(file_path):
+    return os.path.splitext(file_path)[0] + '.obsg'
+
+
+def read_and_initialize_obstacles(file_path, cache=False):
+    """(height, width, ObstacleGrid) of a dataN.txt map.
+
+    With cache=True the packed grid is saved next to the map as
+    dataN.obsg and later calls memory-map that instead of parsing the text
+    again, for as long as it is newer than the map.
+    """
+    cache_file = obstacle_cache_path(file_path)
+    if cache and cache_is_fresh(cache_file, file_path):
+        grid = load_obstacle_grid(cache_file)
+        grid.source = file_path
+        return grid.height, grid.width, grid
+
+    grid_height, grid_width, blocked = parse_obstacle_file(file_path)
+    grid = ObstacleGrid.from_array(blocked)
+    if cache:
+        grid.source = file_path
+        write_cache_file(save_obstacle_grid, grid, cache_file)
+    return grid_height, grid_width, grid
+
+
+def label_components(blocked):
+    """Connected-component label per cell (4-connected), -1 for obstacles.
+
+    Free cells are grouped into horizontal runs with numpy, runs touching
+    vertically are merged with a small union-find, so the Python loop is
+    over runs rather than cells.
+    """
+    free = ~np.asarray(blocked, dtype=bool)
+    grid_height, grid_width = free.shape
+    run_starts = free.copy()
+    run_starts[:, 1:] &= ~free[:, :-1]
+    run_id = np.cumsum(run_starts.reshape(-1)).reshape(grid_height, grid_width) - 1
+    run_count = int(run_starts.sum())
+
+    touching = free[:-1] & free[1:]
+    pairs = np.unique(run_id[:-1][touching].astype(np.int64) * run_count + run_id[1:][touching])
+
+    parent = list(range(run_count))
+
+    def find(run):
+        while parent[run] != run:
+            parent[run] = parent[parent[run]]
+            run = parent[run]
+        return run
+
+    for pair in pairs.tolist():
+        a, b = find(pair // run_count), find(pair % run_count)
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+
+    roots = np.array([find(run) for run in range(run_count)], dtype=np.int32)
+    if not run_count:
+        return np.full(free.shape, -1, dtype=np.int32)
+    return np.where(free, roots[np.maximum(run_id, 0)], -1).astype(np.int32)
+
+
+def component_labels(static_obstacles, grid_height, grid_width):
+    """Flat component labels for the map, cached on an ObstacleGrid."""
+    if isinstance(static_obstacles, ObstacleGrid):
+        if static_obstacles._labels is None:
+            static_obstacles._labels = label_components(static_obstacles.to_array()).reshape(-1)
+        return static_obstacles._labels
+    mask = np.frombuffer(flat_obstacle_mask(static_obstacles, grid_height, grid_width), dtype=np.uint8)
+    return label_components(mask.reshape(grid_height, grid_width) == 1).reshape(-1)
+
+
+def statically_reachable(start, goal, grid_height, grid_width, static_obstacles, occupancy=None):
+    """False when walls alone keep start from ever reaching goal.
+
+    With occupancy, cells agents never leave count as walls too, so a goal
+    sealed off by a parked agent is caught here instead of by a search
+    over every (cell, time % period) state.
+    """
+    if not (0 <= goal[0] < grid_height and 0 <= goal[1] < grid_width):
+        return False
+    if occupancy is None:
+        labels = component_labels(static_obstacles, grid_height, grid_width)
+    else:
+        labels = occupancy.reachability_labels(static_obstacles, grid_height, grid_width)
+    goal_label = labels[goal[0] * grid_width + goal[1]]
+    if goal_label < 0:
+        return False
+    # a robot pushed into a wall can still step out of it
+    candidates = [start] + [(start[0] + dx, start[1] + dy) for dx, dy in ((0, 1), (1, 0), (0, -1), (-1, 0))]
+    for i, j in candidates:
+        if 0 <= i < grid_height and 0 <= j < grid_width and labels[i * grid_width + j] == goal_label:
+            return True
+    return False
+
+
+def flat_obstacle_mask(static_obstacles, grid_height, grid_width):
+    """Row-major bytes with 1 for every obstacle cell, for integer-indexed searches."""
+    if isinstance(static_obstacles, ObstacleGrid):
+        return static_obstacles.flat_mask()
+    mask = bytearray(grid_height * grid_width)
+    for i, j in static_obstacles:
+        if 0 <= i < grid_height and 0 <= j < grid_width:
+            mask[i * grid_width + j] = 1
+    return bytes(mask)
+
+
+def _deep_sizeof(obstacle_set):
+    # the set itself, every tuple in it and every int not in the small int cache
+    size = sys.getsizeof(obstacle_set)
+    for cell in obstacle_set:
+        size += sys.getsizeof(cell)
+        size += sum(sys.getsizeof(v) for v in cell if not -5 <= v <= 256)
+    return size
+
+
+def report_obstacle_storage(file_path, lookups=200000):
+    """Compare memory and lookup speed of ObstacleGrid against the old tuple set."""
+    grid_height, grid_width, grid = read_and_initialize_obstacles(file_path)
+    obstacle_set = set(grid)
+
+    rng = np.random.default_rng(0)
+    cells = list(zip(rng.integers(0, grid_height, lookups).tolist(),
+                     rng.integers(0, grid_width, lookups).tolist()))
+
+    def lookup_all(obstacles):
+        return sum(1 for cell in cells if cell in obstacles)
+
+    assert lookup_all(grid) == lookup_all(obstacle_set)
+    set_time = min(timeit.repeat(lambda: lookup_all(obstacle_set), number=1, repeat=3))
+    grid_time = min(timeit.repeat(lambda: lookup_all(grid), number=1, repeat=3))
+
+    print(f'{file_path}: {grid_height}x{grid_width}, {len(obstacle_set)} obstacles')
+    print(f'  tuple set   : {_deep_sizeof(obstacle_set) / 1e6:8.2f} MB, {lookups / set_time / 1e6:6.2f} M lookups/s')
+    print(f'  ObstacleGrid: {grid.nbytes() / 1e6:8.2f} MB, {lookups / grid_time / 1e6:6.2f} M lookups/s')
+
+
+class AgentOccupancy:
+    """Space-time index of the cells agents block.
+
+    Built once from read_agents output. Maps each cell an agent ever visits
+    to the (period, time mod period) pairs at which it is blocked, so a
+    lookup only looks at that one cell instead of every agent.
+    """
+
+    def __init__(self, agents):
+        cells = {}
+        for agent in agents.values():
+            period = len(agent['times'])
+            # same pairing as is_cell_free: path[i] is used at times[i]
+            for pos, t in zip(agent['path'], agent['times']):
+                # a time outside 0..period-1 never matches time_step % period
+                if 0 <= t < period:
+                    cells.setdefault(pos, set()).add((period, t))
+        self._set_cells({cell: tuple(sorted(entries)) for cell, entries in cells.items()})
+
+    def _set_cells(self, cells):
+        self.cells = cells
+        self._indexed = {}
+        self._parked = None
+        self._labels = MapCache(2)
+        # the whole agent schedule repeats every `period` steps
+        self.period = math.lcm(*{period for entries in self.cells.values() for period, _ in entries})
+
+    @classmethod
+    def from_array(cls, table):
+        """Rebuild the index from (row, col, period, phase) rows, e.g. to_array() output.
+
+        Rows are sorted by cell and then entry with numpy and repeated rows
+        dropped, so only the dict itself is built in python.
+        """
+        table = np.asarray(table, dtype=np.int64).reshape(-1, 4)
+        cell_keys = (table[:, 0] << 32) | (table[:, 1] & 0xFFFFFFFF)
+        entry_keys = (table[:, 2] << 32) | (table[:, 3] & 0xFFFFFFFF)
+        order = np.lexsort((entry_keys, cell_keys))
+        table, cell_keys, entry_keys = table[order], cell_keys[order], entry_keys[order]
+        new_cell = np.ones(len(table), dtype=bool)
+        new_cell[1:] = cell_keys[1:] != cell_keys[:-1]
+        keep = new_cell.copy()
+        keep[1:] |= entry_keys[1:] != entry_keys[:-1]
+        table, new_cell = table[keep], new_cell[keep]
+
+        starts = np.flatnonzero(new_cell)
+        bounds = np.append(starts, len(table)).tolist()
+        entries = list(zip(table[:, 2].tolist(), table[:, 3].tolist()))
+        cells = zip(table[starts, 0].tolist(), table[starts, 1].tolist())
+        occupancy = cls.__new__(cls)
+        occupancy._set_cells({cell: tuple(entries[start:end])
+                              for cell, start, end in zip(cells, bounds[:-1], bounds[1:])})
+        return occupancy
+
+    def to_array(self):
+        """(n, 4) int32 array of (row, col, period, phase) rows, one per entry."""
+        rows = [(i, j, period, phase) for (i, j), entries in self.cells.items() for period, phase in entries]
+        return np.array(rows, dtype=np.int32).reshape(-1, 4)
+
+    def indexed(self, grid_width):
+        """Same index keyed by the flat cell number i * grid_width + j."""
+        if grid_width not in self._indexed:
+            self._indexed[grid_width] = {i * grid_width + j: entries
+                                         for (i, j), entries in self.cells.items()}
+        return self._indexed[grid_width]
+
+    def is_blocked(self, cell, time_step):
+        entries = self.cells.get(cell)
+        if entries is None:
+            # most cells are never visited by any agent
+            return False
+        for period, phase in entries:
+            if time_step % period == phase:
+                return True
+        return False
+
+    def always_blocked(self, cell):
+        """True if agents cover `cell` at every time step (e.g. an agent parked there)."""
+        entries = self.cells.get(cell)
+        if entries is None:
+            return False
+        cycle = math.lcm(*{period for period, _ in entries})
+        blocked = set()
+        for period, phase in entries:
+            blocked.update(range(phase, cycle, period))
+        return len(blocked) == cycle
+
+    def parked_cells(self):
+        """Every cell always_blocked is true for, worked out once."""
+        if self._parked is None:
+            # covering every step takes at least as many entries as the shortest period
+            self._parked = [cell for cell, entries in self.cells.items()
+                            if len(entries) >= min(period for period, _ in entries) and self.always_blocked(cell)]
+        return self._parked
+
+    def reachability_labels(self, static_obstacles, grid_height, grid_width):
+        """component_labels of the map with the parked cells counted as walls."""
+        parked = self.parked_cells()
+        if not parked:
+            return component_labels(static_obstacles, grid_height, grid_width)
+
+        def build():
+            mask = np.frombuffer(flat_obstacle_mask(static_obstacles, grid_height, grid_width),
+                                 dtype=np.uint8).reshape(grid_height, grid_width) == 1
+            for i, j in parked:
+                if 0 <= i < grid_height and 0 <= j < grid_width:
+                    mask[i, j] = True
+            return label_components(mask).reshape(-1)
+        return self._labels.get(static_obstacles, (grid_height, grid_width), build)
+
+
+def is_cell_free(cell, time_step, static_obstacles, agents, occupancy=None):
     # Check against static obstacles
     if cell in static_obstacles:
         # print(f'Cell {cell} is an obstacle!')
         return False
 
+    # use the prebuilt index when we have one
+    if occupancy is not None:
+        return not occupancy.is_blocked(cell, time_step)
+
     # Check against agents
     for agent in agents.values():
         path = agent['path']
@@ -33,4 +452,8 @@ def is_cell_free(cell, time_step, static_obstacles, agents):
             if t == time_step % len(times):
                 if path[i] == cell:
                     return False
-    return True
\ No newline at end of file
+    return True
+
+if __name__ == "__main__":
+    for path in sys.argv[1:] or ['Data/data2.txt']:
+        report_obstacle_storage(path)
@@ -0,0 +1,373 @@
+# Hassan Imrman
+# 22I-0813
+# Section E
+
+# hierarchical A* (HPA*, Botea et al.) over the static map
+# the grid is cut into square clusters. every free stretch of border between
+# two neighbouring clusters is an entrance with one or two transition cells
+# on each side, and the transitions of a cluster are linked by how far apart
+# they are walking inside it. a long query is then a small search over
+# transitions, and each hop is turned back into cells inside one cluster.
+# agents are left out of all that: repair_path searches the time axis again
+# only around the steps where one of them is in the way
+
+import math
+import os
+import struct
+from collections import deque
+from heapq import heappush, heappop
+import numpy as np
+from cache import MapCache, cache_is_fresh, write_cache_file
+from grid import AgentOccupancy, flat_obstacle_mask, statically_reachable
+from pathfinding import a_star_search_array, repair_path, merge_stats
+
+CLUSTER_SIZE = 32
+# entrances at least this wide get a transition at both ends, narrower
+# ones a single one in the middle
+WIDE_ENTRANCE = 6
+
+# header of the binary graph file: magic, height, width, cluster size, nodes, edges
+GRAPH_HEADER = struct.Struct('<4sIIIII')
+GRAPH_MAGIC = b'HPAG'
+
+# graphs of the last few maps, see cluster_graph
+GRAPH_CACHE_SIZE = 4
+_graph_cache = MapCache(GRAPH_CACHE_SIZE)
+
+
+def _runs(mask, cluster_size):
+    """(start, end) of every run of True in mask, cut at cluster boundaries."""
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    runs = []
+    for start, end in zip(edges[0::2].tolist(), edges[1::2].tolist()):
+        while start < end:
+            stop = min(end, (start // cluster_size + 1) * cluster_size)
+            runs.append((start, stop))
+            start = stop
+    return runs
+
+
+def _cluster_distances(free, cluster_size, nodes, pairs):
+    """Walking distance inside their cluster for every (a, b) pair of nodes, -1 = unreachable.
+
+    Every cluster row is one uint64 bit mask, so a BFS step for all nodes
+    of all clusters at once is a few shifts and ands on an (n, cluster_size)
+    array.
+    """
+    grid_height, grid_width = free.shape
+    rows, cols = math.ceil(grid_height / cluster_size), math.ceil(grid_width / cluster_size)
+    # (cluster row, cluster col, row in cluster) -> bits of the free cells
+    grid = np.zeros((rows * cluster_size, cols * cluster_size), dtype=bool)
+    grid[:grid_height, :grid_width] = free
+    padded = np.zeros((rows * cluster_size, cols, 64), dtype=bool)
+    padded[:, :, :cluster_size] = grid.reshape(rows * cluster_size, cols, cluster_size)
+    bits = np.packbits(padded, axis=-1, bitorder='little').view('<u8')[..., 0]
+    bits = bits.reshape(rows, cluster_size, cols).transpose(0, 2, 1).reshape(rows * cols, cluster_size)
+
+    local_row, local_col = nodes[:, 0] % cluster_size, nodes[:, 1] % cluster_size
+    cluster = nodes[:, 0] // cluster_size * cols + nodes[:, 1] // cluster_size
+    allowed = bits[cluster]
+    frontier = np.zeros_like(allowed)
+    frontier[np.arange(len(nodes)), local_row] = np.uint64(1) << local_col.astype(np.uint64)
+    reached = frontier.copy()
+
+    source, target = pairs[:, 0], pairs[:, 1]
+    target_row, target_bit = local_row[target], local_col[target].astype(np.uint64)
+    distances = np.where(source == target, 0, -1).astype(np.int32)
+    one = np.uint64(1)
+    step = 0
+    while frontier.any():
+        step += 1
+        grown = (frontier << one) | (frontier >> one)
+        grown[:, 1:] |= frontier[:, :-1]
+        grown[:, :-1] |= frontier[:, 1:]
+        grown &= allowed
+        grown &= ~reached
+        reached |= grown
+        hit = (distances < 0) & ((grown[source, target_row] >> target_bit) & one).astype(bool)
+        distances[hit] = step
+        frontier = grown
+    return distances
+
+
+class ClusterGraph:
+    """Transition cells of one map and the walking costs between them.
+
+    nodes is an (n, 2) array of transition cells, edges an (m, 3) array of
+    (a, b, cost) rows listed in both directions: cost 1 across an entrance,
+    the distance inside the cluster between two transitions of the same
+    cluster otherwise. `blocked` (the flat obstacle mask) is set by
+    cluster_graph, it isn't part of the saved graph.
+    """
+
+    def __init__(self, grid_height, grid_width, cluster_size, nodes, edges):
+        self.grid_height = grid_height
+        self.grid_width = grid_width
+        self.cluster_size = cluster_size
+        self.cluster_cols = math.ceil(grid_width / cluster_size)
+        self.nodes = nodes
+        self.edges = edges
+        self.blocked = None
+
+        self.node_cells = [tuple(cell) for cell in nodes.tolist()]
+        # edges grouped by their first node: node a's are first[a]:first[a + 1]
+        order = np.argsort(edges[:, 0], kind='stable')
+        self.first = np.searchsorted(edges[order, 0], np.arange(len(nodes) + 1)).tolist()
+        self.targets = edges[order, 1].tolist()
+        self.costs = edges[order, 2].tolist()
+        self.cluster_nodes = {}
+        for node, cell in enumerate(self.node_cells):
+            self.cluster_nodes.setdefault(self.cluster_of(cell), []).append(node)
+        # cells between two transitions, filled in as queries need them
+        self._paths = {}
+
+    @classmethod
+    def build(cls, grid_height, grid_width, static_obstacles, cluster_size=CLUSTER_SIZE):
+        if not 1 < cluster_size <= 64:
+            raise ValueError('cluster_size must be between 2 and 64, a cluster row is one 64 bit mask')
+        free = np.frombuffer(flat_obstacle_mask(static_obstacles, grid_height, grid_width),
+                             dtype=np.uint8).reshape(grid_height, grid_width) == 0
+        index = {}
+        edges = []
+
+        def node(cell):
+            if cell not in index:
+                index[cell] = len(index)
+            return index[cell]
+
+        def entrance(first, second):
+            a, b = node(first), node(second)
+            edges.extend(((a, b, 1), (b, a, 1)))
+
+        def transitions(start, end):
+            if end - start >= WIDE_ENTRANCE:
+                return start, end - 1
+            return ((start + end - 1) // 2,)
+
+        # borders between cluster columns, then between cluster rows
+        for y in range(cluster_size, grid_width, cluster_size):
+            for start, end in _runs(free[:, y - 1] & free[:, y], cluster_size):
+                for x in transitions(start, end):
+                    entrance((x, y - 1), (x, y))
+        for x in range(cluster_size, grid_height, cluster_size):
+            for start, end in _runs(free[x - 1] & free[x], cluster_size):
+                for y in transitions(start, end):
+                    entrance((x - 1, y), (x, y))
+
+        nodes = np.array(list(index), dtype=np.int32).reshape(-1, 2)
+        # every ordered pair of distinct nodes in the same cluster
+        cluster = nodes[:, 0] // cluster_size * math.ceil(grid_width / cluster_size) + nodes[:, 1] // cluster_size
+        order = np.argsort(cluster, kind='stable')
+        bounds = np.flatnonzero(np.diff(cluster[order])) + 1
+        pairs = [np.stack(np.meshgrid(members, members, indexing='ij'), axis=-1).reshape(-1, 2)
+                 for members in np.split(order, bounds)]
+        pairs = np.concatenate(pairs) if len(order) else np.zeros((0, 2), dtype=np.int64)
+        pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+
+        distances = _cluster_distances(free, cluster_size, nodes, pairs)
+        linked = distances > 0
+        edges = np.concatenate((np.array(edges, dtype=np.int32).reshape(-1, 3),
+                                np.column_stack((pairs[linked], distances[linked])).astype(np.int32)))
+        return cls(grid_height, grid_width, cluster_size, nodes, edges)
+
+    def cluster_of(self, cell):
+        return (cell[0] // self.cluster_size) * self.cluster_cols + cell[1] // self.cluster_size
+
+    def _bfs(self, source, target=None):
+        """Distances and parents from source, staying inside its cluster."""
+        size, width = self.cluster_size, self.grid_width
+        top, left = source[0] // size * size, source[1] // size * size
+        bottom, right = min(top + size, self.grid_height), min(left + size, width)
+        blocked = self.blocked
+        distance = {source: 0}
+        parent = {source: None}
+        queue = deque([source])
+        while queue:
+            cell = queue.popleft()
+            if cell == target:
+                break
+            x, y = cell
+            for nx, ny in ((x, y + 1), (x + 1, y), (x, y - 1), (x - 1, y)):
+                if (top <= nx < bottom and left <= ny < right and (nx, ny) not in distance
+                        and not blocked[nx * width + ny]):
+                    distance[(nx, ny)] = distance[cell] + 1
+                    parent[(nx, ny)] = cell
+                    queue.append((nx, ny))
+        return distance, parent
+
+    def _local_path(self, first, second):
+        """Cells after `first` up to `second`, inside first's cluster."""
+        _, parent = self._bfs(first, second)
+        cells = []
+        cell = second
+        while cell != first:
+            cells.append(cell)
+            cell = parent[cell]
+        return cells[::-1]
+
+    def _hop(self, first, second, cached):
+        if cached:
+            key = (first, second)
+            if key not in self._paths:
+                self._paths[key] = self._local_path(first, second)
+            return self._paths[key]
+        return self._local_path(first, second)
+
+    def find_path(self, start, goal, stats=None):
+        """Cells from start to goal over the abstract graph, agents ignored.
+
+        start and goal are linked to the transitions of their own clusters
+        for this query only. Returns None if the abstract search finds
+        nothing (start and goal in different components).
+        """
+        start_distance, _ = self._bfs(start)
+        goal_distance, _ = self._bfs(goal)
+        start_links = [(node, start_distance[self.node_cells[node]])
+                       for node in self.cluster_nodes.get(self.cluster_of(start), ())
+                       if self.node_cells[node] in start_distance]
+        goal_links = {node: goal_distance[self.node_cells[node]]
+                      for node in self.cluster_nodes.get(self.cluster_of(goal), ())
+                      if self.node_cells[node] in goal_distance}
+
+        # -1 is the start and -2 the goal, everything else a transition
+        START, GOAL = -1, -2
+        if goal in start_distance:
+            start_links.append((GOAL, start_distance[goal]))
+        goal_x, goal_y = goal
+
+        def cell_of(node):
+            return start if node == START else goal if node == GOAL else self.node_cells[node]
+
+        cost = {START: 0}
+        parent = {START: None}
+        open_set = [(abs(start[0] - goal_x) + abs(start[1] - goal_y), 0, START)]
+        expanded = 0
+        while open_set:
+            _, g, node = heappop(open_set)
+            if node == GOAL:
+                break
+            if g > cost[node]:
+                continue
+            expanded += 1
+            if node == START:
+                links = start_links
+            else:
+                low, high = self.first[node], self.first[node + 1]
+                links = zip(self.targets[low:high], self.costs[low:high])
+            if node in goal_links:
+                links = list(links) + [(GOAL, goal_links[node])]
+            for other, step in links:
+                new_cost = g + step
+                if new_cost < cost.get(other, new_cost + 1):
+                    cost[other] = new_cost
+                    parent[other] = node
+                    x, y = cell_of(other)
+                    heappush(open_set, (new_cost + abs(x - goal_x) + abs(y - goal_y), new_cost, other))
+        if stats is not None:
+            merge_stats(stats, {'abstract_searches': 1, 'abstract_expanded': expanded})
+        if GOAL not in parent:
+            return None
+
+        hops = [GOAL]
+        while hops[-1] != START:
+            hops.append(parent[hops[-1]])
+        hops.reverse()
+        cells = [start]
+        for first, second in zip(hops, hops[1:]):
+            a, b = cell_of(first), cell_of(second)
+            if self.cluster_of(a) != self.cluster_of(b):
+                # across an entrance
+                cells.append(b)
+            else:
+                # only transition to transition hops are worth keeping
+                cells.extend(self._hop(a, b, first >= 0 and second >= 0))
+        return cells
+
+
+def save_cluster_graph(graph, file_path):
+    with open(file_path, 'wb') as file:
+        file.write(GRAPH_HEADER.pack(GRAPH_MAGIC, graph.grid_height, graph.grid_width, graph.cluster_size,
+                                     len(graph.nodes), len(graph.edges)))
+        file.write(np.ascontiguousarray(graph.nodes, dtype=np.int32).tobytes())
+        file.write(np.ascontiguousarray(graph.edges, dtype=np.int32).tobytes())
+
+
+def load_cluster_graph(file_path):
+    with open(file_path, 'rb') as file:
+        magic, grid_height, grid_width, cluster_size, nodes, edges = GRAPH_HEADER.unpack(
+            file.read(GRAPH_HEADER.size))
+        if magic != GRAPH_MAGIC:
+            raise ValueError(f'{file_path} is not a cluster graph file')
+        node_array = np.frombuffer(file.read(nodes * 8), dtype=np.int32).reshape(nodes, 2)
+        edge_array = np.frombuffer(file.read(edges * 12), dtype=np.int32).reshape(edges, 3)
+    return ClusterGraph(grid_height, grid_width, cluster_size, node_array, edge_array)
+
+
+def graph_cache_path(map_file):
+    return os.path.splitext(map_file)[0] + '.hpa'
+
+
+def cluster_graph(grid_height, grid_width, static_obstacles, cluster_size=CLUSTER_SIZE):
+    """The ClusterGraph of a map, built once.
+
+    Kept in a small LRU keyed by the map object. A map loaded with
+    read_and_initialize_obstacles(..., cache=True) knows its file, and then
+    the graph is also saved next to it as dataN.hpa and reused by later
+    runs for as long as it is newer than the map.
+    """
+    return _graph_cache.get(static_obstacles, (grid_height, grid_width, cluster_size),
+                            lambda: _load_or_build_graph(grid_height, grid_width, static_obstacles, cluster_size))
+
+
+def _load_or_build_graph(grid_height, grid_width, static_obstacles, cluster_size):
+    source = getattr(static_obstacles, 'source', None)
+    cache_file = None if source is None else graph_cache_path(source)
+    graph = None
+    if cache_file and cache_is_fresh(cache_file, source):
+        graph = load_cluster_graph(cache_file)
+        if (graph.grid_height, graph.grid_width, graph.cluster_size) != (grid_height, grid_width, cluster_size):
+            graph = None
+    if graph is None:
+        graph = ClusterGraph.build(grid_height, grid_width, static_obstacles, cluster_size)
+        if cache_file:
+            write_cache_file(save_cluster_graph, graph, cache_file)
+    graph.blocked = flat_obstacle_mask(static_obstacles, grid_height, grid_width)
+    return graph
+
+
+def hpa_search(start, goal, grid_height, grid_width, static_obstacles, agents, current_time, occupancy=None,
+               horizon=None, heuristic_table=None, reservations=None, stats=None, cluster_size=CLUSTER_SIZE):
+    """a_star_search for long trips: abstract search, then cells, then agents.
+
+    Trips shorter than a cluster, cooperative planning (reservations) and
+    anything odd (start off the map or in a wall, goal unreachable) go to
+    a_star_search_array as before. Otherwise the static path from the
+    cluster graph is handed to repair_path, which only searches the time
+    axis around the steps agents block. The path is close to shortest, not
+    always shortest. horizon, when given, is the longest path accepted.
+    """
+    if occupancy is None:
+        occupancy = AgentOccupancy(agents)
+
+    def fallback():
+        return a_star_search_array(start, goal, grid_height, grid_width, static_obstacles, agents, current_time,
+                                   occupancy, horizon, heuristic_table, reservations, stats)
+
+    x, y = start
+    if (reservations is not None or abs(x - goal[0]) + abs(y - goal[1]) <= cluster_size
+            or not (0 <= x < grid_height and 0 <= y < grid_width) or start in static_obstacles
+            or goal in static_obstacles
+            or not statically_reachable(start, goal, grid_height, grid_width, static_obstacles, occupancy)):
+        return fallback()
+
+    graph = cluster_graph(grid_height, grid_width, static_obstacles, cluster_size)
+    cells = graph.find_path(start, goal, stats)
+    path = None if cells is None else repair_path(cells, grid_height, grid_width, static_obstacles, agents,
+                                                  current_time, occupancy, stats)
+    if path is None:
+        return fallback()
+    if horizon is not None and len(path) - 1 > horizon:
+        print("returning no path")
+        return None, None
+    return path, current_time + len(path) - 1
@@ -0,0 +1,219 @@
+# Hassan Imrman
+# 22I-0813
+# Section E
+
+# jump point search for 4-connected moves, with JPS+ style jump tables
+# of all the equally short static paths only the ones that go sideways
+# first and turn up/down as late as possible are searched, so open stretches
+# are crossed in one jump instead of cell by cell. moving up or down a robot
+# only has to stop where a wall beside it just ended (a forced neighbour);
+# moving sideways it stops wherever a vertical jump from that column finds
+# something. how far every jump goes is precomputed per cell with numpy.
+# agents are ignored by the jumps, repair_path puts the time axis back in
+# only around the steps where an agent is in the way
+
+from heapq import heappush, heappop
+import numpy as np
+from grid import AgentOccupancy, flat_obstacle_mask, statically_reachable
+from cache import MapCache
+from pathfinding import a_star_search_array, repair_path, merge_stats
+
+# directions as (dx, dy), in table order
+UP, DOWN, LEFT, RIGHT = (-1, 0), (1, 0), (0, -1), (0, 1)
+DIRECTIONS = (UP, DOWN, LEFT, RIGHT)
+
+# tables of the last few maps, see jump_tables
+TABLE_CACHE_SIZE = 4
+_table_cache = MapCache(TABLE_CACHE_SIZE)
+
+
+def _steps_to(mask, direction, edge=False):
+    """For every cell, steps in `direction` to the nearest True cell of mask, 0 if none.
+
+    With edge=True the cells past the edge count as True, so for
+    mask = blocked this is the number of free cells ahead plus one.
+    """
+    dx, dy = direction
+    # turn the direction into "towards higher row index"
+    view = mask if dx == 1 else mask[::-1] if dx == -1 else mask.T if dy == 1 else mask.T[::-1]
+    rows = view.shape[0]
+    index = np.where(view, np.arange(rows)[:, None], rows)
+    # nearest True strictly after each row
+    after = np.full(view.shape, rows, dtype=np.int64)
+    after[:-1] = np.minimum.accumulate(index[::-1], axis=0)[::-1][1:]
+    steps = after - np.arange(rows)[:, None]
+    if not edge:
+        steps[after == rows] = 0
+    return steps if dx == 1 else steps[::-1] if dx == -1 else steps.T if dy == 1 else steps[::-1].T
+
+
+class JumpTables:
+    """Per-cell jump distances of one map, flat row-major.
+
+    run[d][c]: free cells from c in direction d before a wall or the edge.
+    jump[d][c]: steps from c in direction d to the next jump point within
+    that run, 0 if there is none. Vertical jump points have a forced
+    neighbour; horizontal ones have a vertical jump point above or below.
+    """
+
+    def __init__(self, grid_height, grid_width, static_obstacles):
+        blocked = np.frombuffer(flat_obstacle_mask(static_obstacles, grid_height, grid_width),
+                                dtype=np.uint8).reshape(grid_height, grid_width) != 0
+        free = ~blocked
+        # moving up or down, a free cell beside us whose neighbour behind us
+        # is a wall (or the edge) has to be looked at: a forced neighbour
+        forced = {}
+        for dx in (-1, 1):
+            behind_left = np.ones_like(blocked)
+            behind_right = np.ones_like(blocked)
+            rows = slice(None, -1) if dx == -1 else slice(1, None)
+            back = slice(1, None) if dx == -1 else slice(None, -1)
+            behind_left[rows, 1:] = blocked[back, :-1]
+            behind_right[rows, :-1] = blocked[back, 1:]
+            left_free = np.zeros_like(free)
+            left_free[:, 1:] = free[:, :-1]
+            right_free = np.zeros_like(free)
+            right_free[:, :-1] = free[:, 1:]
+            forced[dx] = free & ((left_free & behind_left) | (right_free & behind_right))
+
+        run = {direction: _steps_to(blocked, direction, edge=True) - 1 for direction in DIRECTIONS}
+        jump = {}
+        for direction in (UP, DOWN):
+            steps = _steps_to(forced[direction[0]], direction)
+            jump[direction] = np.where((steps > 0) & (steps <= run[direction]), steps, 0)
+        stops = free & ((jump[UP] > 0) | (jump[DOWN] > 0))
+        for direction in (LEFT, RIGHT):
+            steps = _steps_to(stops, direction)
+            jump[direction] = np.where((steps > 0) & (steps <= run[direction]), steps, 0)
+
+        # memoryviews index a lot faster than numpy arrays from python
+        self.run = {d: memoryview(np.ascontiguousarray(run[d], dtype=np.int32).reshape(-1)) for d in DIRECTIONS}
+        self.jump = {d: memoryview(np.ascontiguousarray(jump[d], dtype=np.int32).reshape(-1)) for d in DIRECTIONS}
+        self.blocked = flat_obstacle_mask(static_obstacles, grid_height, grid_width)
+
+
+def jump_tables(grid_height, grid_width, static_obstacles):
+    """JumpTables of a map, kept in a small LRU keyed by the map object."""
+    return _table_cache.get(static_obstacles, (grid_height, grid_width),
+                            lambda: JumpTables(grid_height, grid_width, static_obstacles))
+
+
+def jump_path(start, goal, grid_height, grid_width, tables, stats=None):
+    """Shortest static path from start to goal as a list of cells, or None."""
+    width = grid_width
+    goal_x, goal_y = goal
+    run, jump, blocked = tables.run, tables.jump, tables.blocked
+
+    def next_stop(x, y, direction):
+        # steps to the next jump point (or the goal) going `direction`, 0 if none
+        dx, dy = direction
+        cell = x * width + y
+        reach = run[direction][cell]
+        best = jump[direction][cell]
+        if dx:
+            if y == goal_y and 0 < (goal_x - x) * dx <= reach:
+                distance = (goal_x - x) * dx
+                best = distance if not best or distance < best else best
+        else:
+            if x == goal_x and 0 < (goal_y - y) * dy <= reach:
+                distance = (goal_y - y) * dy
+                best = distance if not best or distance < best else best
+            # the goal's column, if we can walk straight up or down to it from there
+            distance = (goal_y - y) * dy
+            if 0 < distance <= reach and (not best or distance < best) and goal_x != x:
+                up_down = UP if goal_x < x else DOWN
+                if abs(goal_x - x) <= run[up_down][x * width + goal_y]:
+                    best = distance
+        return best
+
+    cost = {start: 0}
+    parent = {start: None}
+    # (f, g, cell, direction we arrived in)
+    open_set = [(abs(start[0] - goal_x) + abs(start[1] - goal_y), 0, start, None)]
+    expanded = 0
+    while open_set:
+        _, g, cell, arrived = heappop(open_set)
+        if g > cost[cell]:
+            continue
+        if cell == goal:
+            break
+        expanded += 1
+        x, y = cell
+        if arrived is None:
+            directions = DIRECTIONS
+        elif arrived[0]:
+            # up/down: keep going, turn only towards forced neighbours
+            directions = [arrived]
+            back = x - arrived[0]
+            for dy in (-1, 1):
+                side = y + dy
+                if (0 <= side < width and not blocked[x * width + side]
+                        and (not 0 <= back < grid_height or blocked[back * width + side])):
+                    directions.append((0, dy))
+        else:
+            # sideways: keep going or turn up/down
+            directions = (arrived, UP, DOWN)
+        for direction in directions:
+            steps = next_stop(x, y, direction)
+            if not steps:
+                continue
+            other = (x + direction[0] * steps, y + direction[1] * steps)
+            new_cost = g + steps
+            if new_cost < cost.get(other, new_cost + 1):
+                cost[other] = new_cost
+                parent[other] = cell
+                heappush(open_set, (new_cost + abs(other[0] - goal_x) + abs(other[1] - goal_y), new_cost,
+                                    other, direction))
+    if stats is not None:
+        merge_stats(stats, {'jump_searches': 1, 'jump_expanded': expanded})
+    if goal not in parent:
+        return None
+
+    # jump points back to the start, then fill in the straight runs between them
+    points = [goal]
+    while points[-1] != start:
+        points.append(parent[points[-1]])
+    points.reverse()
+    path = [start]
+    for (x, y), (next_x, next_y) in zip(points, points[1:]):
+        dx, dy = (next_x > x) - (next_x < x), (next_y > y) - (next_y < y)
+        while (x, y) != (next_x, next_y):
+            x, y = x + dx, y + dy
+            path.append((x, y))
+    return path
+
+
+def jps_search(start, goal, grid_height, grid_width, static_obstacles, agents, current_time, occupancy=None,
+               horizon=None, heuristic_table=None, reservations=None, stats=None):
+    """a_star_search with the static part done by jump point search.
+
+    The shortest path around the walls is found with jump_path and then
+    handed to repair_path, which runs the time expanded search only in
+    windows around the steps agents block. Cooperative planning
+    (reservations) and odd cases (start off the map or in a wall, goal
+    unreachable) go to a_star_search_array as before. horizon, when given,
+    is the longest path accepted.
+    """
+    if occupancy is None:
+        occupancy = AgentOccupancy(agents)
+
+    def fallback():
+        return a_star_search_array(start, goal, grid_height, grid_width, static_obstacles, agents, current_time,
+                                   occupancy, horizon, heuristic_table, reservations, stats)
+
+    x, y = start
+    if (reservations is not None or not (0 <= x < grid_height and 0 <= y < grid_width)
+            or start in static_obstacles or goal in static_obstacles
+            or not statically_reachable(start, goal, grid_height, grid_width, static_obstacles, occupancy)):
+        return fallback()
+
+    tables = jump_tables(grid_height, grid_width, static_obstacles)
+    cells = jump_path(start, goal, grid_height, grid_width, tables, stats)
+    path = None if cells is None else repair_path(cells, grid_height, grid_width, static_obstacles, agents,
+                                                  current_time, occupancy, stats)
+    if path is None:
+        return fallback()
+    if horizon is not None and len(path) - 1 > horizon:
+        print("returning no path")
+        return None, None
+    return path, current_time + len(path) - 1
@@ -4,69 +4,212 @@
 
 import time
 import os
-from grid import read_and_initialize_obstacles,is_cell_free
+import sys
+import random
+import numpy as np
+from grid import read_and_initialize_obstacles,AgentOccupancy
 from robot import read_robots
-from agent import read_agents
+from agent import read_agents, read_agent_schedules
 from robot import Robot
-from collision import detect_robot_collisions,get_random_direction
-
-def display_grid_with_obstacles(grid_height, grid_width, static_obstacles, agents, robots, timestamp):
-    for i in range(grid_height):
-        for j in range(grid_width):
-            if (i, j) in static_obstacles:
-                print('X', end=' ')
-            elif not is_cell_free((i, j), timestamp, static_obstacles, agents):
-                print('A', end=' ')
-            elif any(robot.current == (i, j) for robot in robots):
-                print('R', end=' ')
-            else:
-                print('.', end=' ')
-        print()
-
-def main():
+from collision import CollisionIndex,get_random_direction
+from cooperative import plan_cooperative
+from parallel import plan_parallel
+from fleet import Fleet
+from cbs import cbs_search
+from rolling import plan_rolling, due_for_replan
+from render import GridRenderer
+from replay import ReplayWriter
+
+def display_grid_with_obstacles(grid_height, grid_width, static_obstacles, agents, robots, timestamp, occupancy=None):
+    # one frame from a throwaway GridRenderer, printed in a single write
+    renderer = GridRenderer(grid_height, grid_width, static_obstacles, agents, occupancy)
+    renderer.update([robot.current for robot in robots], timestamp)
+    sys.stdout.write(renderer.frame().decode())
+
+def load_scenario(folder='Data', index=0, cache=False):
+    """Map, agents and robot list of one dataN/AgentN/RobotsN triple."""
     grid_height, grid_width, static_obstacles = read_and_initialize_obstacles(
-        'Data/data0.txt')
-    agents = read_agents(
-        'Data/Agent0.txt')
+        os.path.join(folder, f'data{index}.txt'), cache)
+    agent_file = os.path.join(folder, f'Agent{index}.txt')
+    # the cached schedules come back in time order, same agents
+    agents = read_agent_schedules(agent_file, cache).to_agents() if cache else read_agents(agent_file)
     robot_data = read_robots(
-        'Data/Robots0.txt')
+        os.path.join(folder, f'Robots{index}.txt'))
+    return grid_height, grid_width, static_obstacles, agents, robot_data
+
+# planning='cooperative' plans robots one after another through a shared
+# reservation table; with window set (WHCA*) only `window` steps are
+# reserved and everyone replans every window // 2 ticks.
+# planning='parallel' runs the independent first plans on a process pool,
+# planning='cbs' plans the whole fleet with conflict-based search; cbs_options
+# (suboptimality, max_nodes, time_limit) go to cbs_search and its stats are
+# returned, since a search stopped by a limit hands out paths that still collide
+def plan_initial(robots, grid_height, grid_width, static_obstacles, agents, occupancy, planning='independent', window=None,
+                 cbs_options=None):
+    timestamp = 0
+    if planning == 'cooperative':
+        plan_cooperative(robots, grid_height, grid_width, static_obstacles, agents, timestamp, occupancy, window)
+    elif planning == 'parallel':
+        plan_parallel(robots, grid_height, grid_width, static_obstacles, agents, timestamp, occupancy)
+    elif planning == 'cbs':
+        stats = cbs_search(robots, grid_height, grid_width, static_obstacles, agents, timestamp, occupancy,
+                           **(cbs_options or {}))
+        if not stats['solved']:
+            print(f"CBS stopped unsolved after {stats['expanded']} nodes, "
+                  f"best plan has {stats['conflicts']} conflicts")
+        return stats
+    elif planning == 'rolling':
+        plan_rolling(robots, grid_height, grid_width, static_obstacles, agents, timestamp, occupancy, window)
+    else:
+        for robot in robots:
+            robot.plan_path(grid_height, grid_width, static_obstacles, agents, timestamp, occupancy)
+
+# vectorized=True runs the tick loop on a numpy Fleet instead of Robot objects,
+# render=True draws the grid every tick (only the changed cells) instead of the log,
+# seed makes the random choices repeatable and replay names a file to log the run to
+def main(planning='independent', window=None, vectorized=False, folder='Data', index=0, render=False, seed=None,
+         replay=None):
+    grid_height, grid_width, static_obstacles, agents, robot_data = load_scenario(folder, index)
     
     # print(agents)
+
+    # space-time index of agent cells, built once for the whole run
+    occupancy = AgentOccupancy(agents)
     
     # Create robot instances
-    robots = [Robot(data['start'], data['goal'],static_obstacles,grid_width,grid_height,agents) for data in robot_data]
-
-    timestamp = 0
+    rng = None if seed is None else random.Random(seed)
+    robots = [Robot(data['start'], data['goal'],static_obstacles,grid_width,grid_height,agents, rng=rng, occupancy=occupancy) for data in robot_data]
 
     # plan paths before time starts
+    plan_initial(robots, grid_height, grid_width, static_obstacles, agents, occupancy, planning, window)
+
+    renderer = GridRenderer(grid_height, grid_width, static_obstacles, occupancy=occupancy, ansi=True) if render else None
+    loop = run_fleet if vectorized else simulate
+    writer = None if replay is None else ReplayWriter(replay, grid_height, grid_width, len(robots))
+    try:
+        loop(robots, grid_height, grid_width, static_obstacles, agents, occupancy, planning, window,
+             verbose=not render, renderer=renderer, replay=writer)
+    finally:
+        if writer is not None:
+            writer.close()
+
+def collect_tick_stats(robots):
+    # one dict every robot adds its search stats to; the loops copy it into
+    # tick_stats and empty it at the end of each tick
+    sink = {}
     for robot in robots:
-        robot.plan_path(grid_height, grid_width, static_obstacles, agents, timestamp)
+        if robot.stats is None:
+            robot.stats = {}
+        robot.stats_sink = sink
+    return sink
+
+def simulate(robots, grid_height, grid_width, static_obstacles, agents, occupancy, planning='independent', window=None,
+             verbose=True, max_ticks=None, tick_stats=None, renderer=None, replay=None):
+    # the tick loop; verbose=False skips the screen clearing and printing.
+    # pass a list as tick_stats to get every tick's search stats appended,
+    # a GridRenderer as renderer to have it draw every tick and a
+    # ReplayWriter as replay to log every tick's positions.
+    # returns the number of ticks run
+    timestamp = 0
+    sink = None if tick_stats is None else collect_tick_stats(robots)
+    # spatial hash of robot positions, updated by the robots as they move
+    collisions = CollisionIndex(robots)
 
     while True:
-        os.system('cls')
+        if verbose:
+            os.system('cls')
+
+        if planning == 'cooperative' and window and timestamp and timestamp % max(1, window // 2) == 0:
+            plan_cooperative(robots, grid_height, grid_width, static_obstacles, agents, timestamp, occupancy, window)
+        if planning == 'rolling' and timestamp:
+            plan_rolling(robots, grid_height, grid_width, static_obstacles, agents, timestamp, occupancy, window,
+                         due_for_replan(robots, timestamp, window))
         
         for robot in robots:
-            print("Robot @ ",robot.current)
+            if verbose:
+                print("Robot @ ",robot.current)
             robot.move()
         
-        # Check for collisions
-        collisions = detect_robot_collisions(robots)
-        for colliding_robots in collisions:
-            print(f'Collision detected between robots at position {colliding_robots[0].current}')
-            for robot in colliding_robots:
-                robot.handle_collision(grid_height, grid_width, static_obstacles, agents, timestamp,get_random_direction())
+        # Check for collisions: robots on the same cell or swapping cells
+        vertex, swaps = collisions.detect()
+        if verbose:
+            for cell in sorted({robots[index].current for index in vertex.tolist()}):
+                print(f'Collision detected between robots at position {cell}')
+            for first, second in swaps.tolist():
+                print(f'Robots swapped cells at {robots[first].current} and {robots[second].current}')
+        for index in sorted(set(vertex.tolist()) | set(swaps.ravel().tolist())):
+            robots[index].handle_collision(grid_height, grid_width, static_obstacles, agents, timestamp,get_random_direction(robots[index].rng), occupancy)
         
+        if sink is not None:
+            tick_stats.append(dict(sink))
+            sink.clear()
+
         # Display current state
-        # display_grid_with_obstacles(grid_height, grid_width, static_obstacles, agents, robots, timestamp)
+        if renderer is not None:
+            renderer.draw([robot.current for robot in robots], timestamp)
+        if replay is not None:
+            replay.record([robot.current for robot in robots])
         
         # Check if all robots have reached their goals
         if all(robot.is_done() for robot in robots):
-            for robot in robots:
-                robot.display_path_and_time()
-            break
+            if verbose:
+                for robot in robots:
+                    robot.display_path_and_time()
+            return timestamp + 1
         
         # time.sleep(1)
         timestamp += 1
+        if max_ticks is not None and timestamp >= max_ticks:
+            return timestamp
+
+def run_fleet(robots, grid_height, grid_width, static_obstacles, agents, occupancy, planning='independent', window=None,
+              verbose=True, max_ticks=None, tick_stats=None, renderer=None, replay=None):
+    # same loop as simulate on a Fleet: moves, goal checks and collision
+    # checks are array operations, only robots in a collision go back to Robot
+    fleet = Fleet(robots)
+    timestamp = 0
+    sink = None if tick_stats is None else collect_tick_stats(robots)
+    while True:
+        if planning == 'cooperative' and window and timestamp and timestamp % max(1, window // 2) == 0:
+            for index, robot in enumerate(robots):
+                fleet.to_robot(index, robot)
+            plan_cooperative(robots, grid_height, grid_width, static_obstacles, agents, timestamp, occupancy, window)
+            for index, robot in enumerate(robots):
+                fleet.from_robot(index, robot)
+        if planning == 'rolling' and timestamp:
+            due = due_for_replan(robots, timestamp, window, fleet.done)
+            for index in due:
+                fleet.to_robot(index, robots[index])
+            plan_rolling(robots, grid_height, grid_width, static_obstacles, agents, timestamp, occupancy, window, due)
+            for index in due:
+                fleet.from_robot(index, robots[index])
+
+        fleet.step()
+
+        vertex, swaps = fleet.detect()
+        for index in np.union1d(vertex, swaps.ravel()).tolist():
+            robot = robots[index]
+            fleet.to_robot(index, robot)
+            robot.handle_collision(grid_height, grid_width, static_obstacles, agents, timestamp, get_random_direction(robot.rng), occupancy)
+            fleet.from_robot(index, robot)
+
+        if sink is not None:
+            tick_stats.append(dict(sink))
+            sink.clear()
+
+        if renderer is not None:
+            renderer.draw(fleet.pos, timestamp)
+        if replay is not None:
+            replay.record(fleet.pos)
+
+        done = fleet.all_done()
+        timestamp += 1
+        if done or (max_ticks is not None and timestamp >= max_ticks):
+            for index, robot in enumerate(robots):
+                fleet.to_robot(index, robot)
+                if verbose and done:
+                    robot.display_path_and_time()
+            return timestamp
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,144 @@
+# Hassan Imrman
+# 22I-0813
+# Section E
+
+# initial path planning on a process pool
+# the robots' first plans are independent searches over read-only data, so
+# they can run side by side. the map (packed bits, byte mask and component
+# labels) and the agent index go into shared memory once; every worker maps
+# them when it starts, so a task is just a start, a goal and a time
+
+import multiprocessing
+import numpy as np
+from multiprocessing import shared_memory
+from grid import ObstacleGrid, AgentOccupancy, component_labels
+from pathfinding import goal_distances
+from hpa import cluster_graph
+from robot import PLANNERS
+
+# what a worker attached to: (grid height, grid width, obstacles, occupancy)
+_world = None
+# keeps the worker's shared memory handles open while it runs
+_handles = []
+
+
+class SharedWorld:
+    """Obstacle grid and agent index copied into shared memory blocks.
+
+    spec is what a worker needs to map them again: block names, shapes and
+    dtypes, all small and cheap to pickle. Use as a context manager, the
+    blocks are unlinked on exit.
+    """
+
+    def __init__(self, grid_height, grid_width, static_obstacles, occupancy):
+        if not isinstance(static_obstacles, ObstacleGrid):
+            blocked = np.zeros((grid_height, grid_width), dtype=bool)
+            for i, j in static_obstacles:
+                if 0 <= i < grid_height and 0 <= j < grid_width:
+                    blocked[i, j] = True
+            static_obstacles = ObstacleGrid.from_array(blocked)
+
+        self.blocks = []
+        flat = np.frombuffer(static_obstacles.flat_mask(), dtype=np.uint8)
+        labels = np.asarray(component_labels(static_obstacles, grid_height, grid_width))
+        self.spec = {
+            'height': grid_height,
+            'width': grid_width,
+            'bits': self._share(np.ascontiguousarray(static_obstacles.bits)),
+            'flat': self._share(flat),
+            'labels': self._share(labels),
+            'agents': self._share(occupancy.to_array()),
+            'source': getattr(static_obstacles, 'source', None),
+        }
+
+    def _share(self, array):
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        self.blocks.append(block)
+        return block.name, array.shape, array.dtype.str
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _attach(spec, moves=()):
+    # pool initializer: map the shared blocks, nothing is copied
+    global _world
+
+    def view(entry):
+        name, shape, dtype = entry
+        block = shared_memory.SharedMemory(name=name)
+        _handles.append(block)
+        return np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+
+    grid = ObstacleGrid(view(spec['bits']), spec['height'], spec['width'])
+    grid._flat = view(spec['flat']).data
+    grid._labels = view(spec['labels'])
+    grid.source = spec['source']
+    occupancy = AgentOccupancy.from_array(view(spec['agents']))
+    _world = (spec['height'], spec['width'], grid, occupancy, moves)
+
+
+def _plan_one(task):
+    index, start, goal, current_time, horizon, planner, model, counted = task
+    grid_height, grid_width, grid, occupancy, moves = _world
+    distances = None if planner in ('hpa', 'jps') else goal_distances(goal, grid_height, grid_width, grid)
+    # the searches only fall back to the raw agents when there is no index
+    extra = {} if model is None else {'moves': moves[model]}
+    # the robot's stats dict lives in the parent, the counters travel back with the path
+    stats = extra['stats'] = {} if counted else None
+    path, total_time = PLANNERS[planner](start, goal, grid_height, grid_width, grid, {},
+                                         current_time, occupancy, horizon, distances, **extra)
+    return index, path, total_time, stats
+
+
+def plan_parallel(robots, grid_height, grid_width, static_obstacles, agents, current_time, occupancy=None,
+                  processes=None, horizon=None, planner=None):
+    """plan_path for every robot that isn't done, spread over a process pool.
+
+    processes defaults to the number of cores. Robots get the same paths as
+    calling plan_path on each of them in turn.
+    """
+    if occupancy is None:
+        occupancy = AgentOccupancy(agents)
+    # robots' move models go to each worker once, tasks only name them
+    models = {}
+    for robot in robots:
+        if robot.moves is not None:
+            models.setdefault(id(robot.moves), (len(models), robot.moves))
+    moves = [model for _, model in models.values()]
+    # like plan_path, robots with a window (rolling horizon) only plan that far
+    tasks = [(index, robot.current, robot.goal, current_time, robot.window if horizon is None else horizon,
+              planner or robot.planner,
+              None if robot.moves is None else models[id(robot.moves)][0], robot.stats is not None)
+             for index, robot in enumerate(robots) if not robot.is_done()]
+    if not tasks:
+        return
+    if getattr(static_obstacles, 'source', None) and any(task[5] == 'hpa' for task in tasks):
+        # build the cluster graph file once here instead of in every worker
+        cluster_graph(grid_height, grid_width, static_obstacles)
+
+    with SharedWorld(grid_height, grid_width, static_obstacles, occupancy) as world:
+        with multiprocessing.Pool(processes, initializer=_attach, initargs=(world.spec, moves)) as pool:
+            # longest trips first so one big search doesn't finish last alone
+            tasks.sort(key=lambda task: -abs(task[1][0] - task[2][0]) - abs(task[1][1] - task[2][1]))
+            for index, path, total_time, stats in pool.imap_unordered(_plan_one, tasks):
+                robot = robots[index]
+                if stats is not None:
+                    robot.add_stats(stats)
+                if path:
+                    robot.path = path[1:]
+                    robot.total_time = total_time
+                else:
+                    print("Robot can't find path!")
+                    robot.path = []
+                    robot.noPath = True
@@ -2,73 +2,519 @@
 # 22I-0813
 # Section E
 
+import time
+from array import array
 from heapq import heappush, heappop
-from grid import is_cell_free
+import numpy as np
+from grid import is_cell_free, AgentOccupancy, flat_obstacle_mask, statically_reachable
+from cache import MapCache
+
+# bits reserved for the time offset when packing a state into a heap key
+TIME_BITS = 24
+# so a search never looks further ahead than this
+MAX_STEPS = (1 << TIME_BITS) - 1
+
+# how many per-goal distance tables we keep around
+DISTANCE_CACHE_SIZE = 32
+_distance_cache = MapCache(DISTANCE_CACHE_SIZE)
 
 # manhattan distance to estimate cost
 # wen movement only 4 directions :  dx + dy
 def heuristic(start, goal):
     return abs(start[0] - goal[0]) + abs(start[1] - goal[1])
 
+
+def goal_distances(goal, grid_height, grid_width, static_obstacles):
+    """True walking distance from every cell to goal, ignoring agents.
+
+    Backward BFS from the goal over the static map, flat row-major, -1 where
+    the goal can't be reached. Tables are kept in a small LRU keyed by the
+    map object and the goal, so robots sharing a goal, or one robot
+    replanning after a collision, reuse the same table.
+    """
+    return _distance_cache.get(static_obstacles, (grid_height, grid_width, goal),
+                               lambda: _bfs_distances(goal, grid_height, grid_width, static_obstacles))
+
+
+def _bfs_distances(goal, grid_height, grid_width, static_obstacles):
+    cells = grid_height * grid_width
+    blocked = flat_obstacle_mask(static_obstacles, grid_height, grid_width)
+    distances = array('i', [-1]) * cells
+    goal_x, goal_y = goal
+    if 0 <= goal_x < grid_height and 0 <= goal_y < grid_width and not blocked[goal_x * grid_width + goal_y]:
+        goal_cell = goal_x * grid_width + goal_y
+        distances[goal_cell] = 0
+        frontier = [goal_cell]
+        distance = 0
+        while frontier:
+            distance += 1
+            next_frontier = []
+            push = next_frontier.append
+            for cell in frontier:
+                y = cell % grid_width
+                if y + 1 < grid_width and distances[cell + 1] < 0 and not blocked[cell + 1]:
+                    distances[cell + 1] = distance
+                    push(cell + 1)
+                if y > 0 and distances[cell - 1] < 0 and not blocked[cell - 1]:
+                    distances[cell - 1] = distance
+                    push(cell - 1)
+                below, above = cell + grid_width, cell - grid_width
+                if below < cells and distances[below] < 0 and not blocked[below]:
+                    distances[below] = distance
+                    push(below)
+                if above >= 0 and distances[above] < 0 and not blocked[above]:
+                    distances[above] = distance
+                    push(above)
+            frontier = next_frontier
+    return distances
+
+
+def static_path(start, distances, grid_height, grid_width):
+    """Shortest path from start on the walls-only map, read off a goal_distances table.
+
+    Every step goes to a neighbour one closer to the goal. None if start is
+    off the map or can't reach the goal.
+    """
+    x, y = start
+    if not (0 <= x < grid_height and 0 <= y < grid_width) or distances[x * grid_width + y] < 0:
+        return None
+    path = [start]
+    distance = distances[x * grid_width + y]
+    while distance:
+        # right, down, left, up
+        for nx, ny in ((x, y + 1), (x + 1, y), (x, y - 1), (x - 1, y)):
+            if 0 <= nx < grid_height and 0 <= ny < grid_width and distances[nx * grid_width + ny] == distance - 1:
+                break
+        x, y, distance = nx, ny, distance - 1
+        path.append((x, y))
+    return path
+
+
+def default_horizon(grid_height, grid_width, occupancy, current_time, reservations=None):
+    """Longest a shortest path can be: every (cell, time % period) state once,
+    after the last reservation (until then time itself is the state)."""
+    settle = 0 if reservations is None else max(0, reservations.settle_time - current_time)
+    # and no further than a_star_search_array's states can count
+    return min(grid_height * grid_width * occupancy.period + settle, MAX_STEPS)
+
+
+def merge_stats(total, stats):
+    """Add one stats dict into another: max_* keys keep the maximum, the rest add up."""
+    for key, value in stats.items():
+        if key.startswith('max_'):
+            total[key] = max(total.get(key, value), value)
+        else:
+            total[key] = total.get(key, 0) + value
+    return total
+
+
+class SearchProbe:
+    """Counting stand-ins for heappush, heappop and is_cell_free.
+
+    A search only builds one when it is given a stats dict; otherwise the
+    same local names are bound to the plain functions, so leaving stats
+    off costs nothing. record() adds the counters to the stats dict:
+    searches, expanded, pushes, stale_pops, is_cell_free_calls,
+    is_cell_free_time (seconds), max_open and max_depth (time steps ahead
+    of the start).
+    """
+
+    def __init__(self):
+        self.pushes = 0
+        self.pops = 0
+        self.max_open = 1
+        self.cell_checks = 0
+        self.cell_time = 0.0
+
+    def push(self, heap, item):
+        heappush(heap, item)
+        self.pushes += 1
+        if len(heap) > self.max_open:
+            self.max_open = len(heap)
+
+    def pop(self, heap):
+        self.pops += 1
+        return heappop(heap)
+
+    def cell_free(self, cell, time_step, static_obstacles, agents, occupancy=None):
+        self.cell_checks += 1
+        started = time.perf_counter()
+        free = is_cell_free(cell, time_step, static_obstacles, agents, occupancy)
+        self.cell_time += time.perf_counter() - started
+        return free
+
+    def counted(self, index):
+        """Wrap an occupancy index so each lookup counts as an is_cell_free call."""
+        probe = self
+
+        class CountedIndex:
+            def get(self, cell):
+                probe.cell_checks += 1
+                started = time.perf_counter()
+                entries = index.get(cell)
+                probe.cell_time += time.perf_counter() - started
+                return entries
+
+        return CountedIndex()
+
+    def record(self, stats, closed, depth):
+        # every expanded state is closed exactly once, other pops were stale
+        merge_stats(stats, {
+            'searches': 1,
+            'expanded': len(closed),
+            'pushes': self.pushes,
+            'stale_pops': self.pops - len(closed),
+            'is_cell_free_calls': self.cell_checks,
+            'is_cell_free_time': self.cell_time,
+            'max_open': self.max_open,
+            'max_depth': depth,
+        })
+
+
+def table_heuristic(distances, grid_width):
+    """heuristic() replacement reading a goal_distances table (-1 = dead end)."""
+    def estimate(pos, goal):
+        return distances[pos[0] * grid_width + pos[1]]
+    return estimate
+
+# moves a MoveModel is built from, in search order
+STRAIGHT_MOVES = ((0, 1), (1, 0), (0, -1), (-1, 0))  # right, down, left, up
+DIAGONAL_MOVES = ((1, 1), (1, -1), (-1, -1), (-1, 1))
+WAIT_MOVE = (0, 0)
+
+
+class MoveModel:
+    """Which moves a robot has and what they cost.
+
+    connectivity is 4 (right, down, left, up) or 8 (the diagonals too, but
+    never across a wall's corner); wait=True lets a robot stay put for a
+    tick, so it can let an agent pass instead of walking around it. Every
+    action takes one tick. terrain is an optional (height, width) array of
+    cell costs (see grid.read_terrain_costs): an action costs the terrain
+    of the cell it ends on, 1 without terrain. The offsets are worked out
+    once, as arrays and as tuples of plain ints for the search loops.
+    """
+
+    def __init__(self, connectivity=4, wait=False, terrain=None):
+        if connectivity not in (4, 8):
+            raise ValueError(f'connectivity must be 4 or 8, not {connectivity}')
+        self.connectivity = connectivity
+        self.wait = wait
+        self.moves = STRAIGHT_MOVES + (DIAGONAL_MOVES if connectivity == 8 else ()) + ((WAIT_MOVE,) if wait else ())
+        self.offsets = np.array(self.moves, dtype=np.int64)
+        # bytes: cheap to index and to pickle for the process pool
+        self.shape = None if terrain is None else np.shape(terrain)
+        self.costs = None if terrain is None else np.ascontiguousarray(terrain, dtype=np.uint8).tobytes()
+        if self.costs is not None and min(self.costs, default=1) < 1:
+            raise ValueError('terrain costs must be at least 1')
+        self._flat = {}
+
+    def is_plain(self):
+        """True for the original model: 4-connected, no waiting, every step costs 1."""
+        return self.connectivity == 4 and not self.wait and self.costs is None
+
+    def flat_moves(self, grid_width):
+        """(dx, dy, flat offset, diagonal) of every move on a grid_width wide map."""
+        moves = self._flat.get(grid_width)
+        if moves is None:
+            deltas = self.offsets @ np.array([grid_width, 1])
+            diagonal = (self.offsets != 0).all(axis=1)
+            moves = tuple(zip(self.offsets[:, 0].tolist(), self.offsets[:, 1].tolist(), deltas.tolist(),
+                              diagonal.tolist()))
+            self._flat[grid_width] = moves
+        return moves
+
+    def check_map(self, grid_height, grid_width):
+        if self.shape is not None and tuple(self.shape) != (grid_height, grid_width):
+            raise ValueError(f'terrain is {self.shape[0]}x{self.shape[1]}, the map {grid_height}x{grid_width}')
+
+    def distance(self, pos, goal):
+        """Lower bound on the cost from pos to goal (terrain never costs less than 1)."""
+        dx, dy = abs(pos[0] - goal[0]), abs(pos[1] - goal[1])
+        return max(dx, dy) if self.connectivity == 8 else dx + dy
+
+    def admits_table(self):
+        """goal_distances counts 4-connected steps, too much once diagonals are allowed."""
+        return self.connectivity == 4
+
+
+# the original moves
+FOUR_CONNECTED = MoveModel()
+
+
 # return valid neighbors
-def get_neighbors(pos, grid_height, grid_width):
-    directions = [(0, 1), (1, 0), (0, -1), (-1, 0)]  # right, down, left, up
+# pass static_obstacles to also drop neighbors that are walls (and, with
+# diagonal moves, the diagonals that would cut a wall's corner)
+def get_neighbors(pos, grid_height, grid_width, static_obstacles=None, moves=None):
+    x, y = pos
     neighbors = []
-    for dx, dy in directions:
-        new_x, new_y = pos[0] + dx, pos[1] + dy
+    for dx, dy in (FOUR_CONNECTED if moves is None else moves).moves:
+        new_x, new_y = x + dx, y + dy
         if 0 <= new_x < grid_height and 0 <= new_y < grid_width:
+            if static_obstacles is not None:
+                if (new_x, new_y) in static_obstacles:
+                    continue
+                if dx and dy and ((new_x, y) in static_obstacles or (x, new_y) in static_obstacles):
+                    continue
             neighbors.append((new_x, new_y))
     return neighbors
 
-def a_star_search(start, goal, grid_height, grid_width, static_obstacles, agents, current_time):
-    # min heap for unexplored nodes
-    open_set = [(0, current_time, start)]  # (f_score, time, position)
-    came_from = {}
+def a_star_search(start, goal, grid_height, grid_width, static_obstacles, agents, current_time, occupancy=None, horizon=None, heuristic_table=None, reservations=None, stats=None, moves=None):
+    """Time aware A* from start to goal around the agents (and reservations).
+
+    Returns (path, arrival time) with path[0] == start, or (None, None).
+    The search runs on flat integer states, see a_star_search_array.
+    """
+    return a_star_search_array(start, goal, grid_height, grid_width, static_obstacles, agents, current_time,
+                               occupancy, horizon, heuristic_table, reservations, stats, moves)
+
+
+def a_star_search_array(start, goal, grid_height, grid_width, static_obstacles, agents, current_time, occupancy=None, horizon=None, heuristic_table=None, reservations=None, stats=None, moves=None, cutoff=False):
+    """A* over (cell, time) on flat integer states.
+
+    A state (x, y, t) is encoded as (t - start_time) * cells + x * width + y,
+    and a heap entry as f * stride + state, so the open set holds plain ints
+    ordered by (f, time, position) and came_from is an int -> int dict. With
+    the plain moves every step costs 1, so g is just t - start_time and
+    needs no table; a MoveModel (waits, diagonals, terrain) keeps a g table,
+    since a state can then be reached again more cheaply.
+
+    cutoff=True makes horizon a window (rolling horizon planning): the first
+    state popped `horizon` steps ahead ends the search like the goal does,
+    scored by its estimate for the rest of the trip, and its path is
+    returned. Ties on f then go to the deeper state, so with an exact
+    estimate the search runs straight down the window instead of widening
+    every step of it. If agents box the robot in, the path to the deepest
+    state expanded comes back (maybe just [start]).
+    """
+    if occupancy is None:
+        occupancy = AgentOccupancy(agents)
+    if moves is not None and moves.is_plain():
+        moves = None
+    if moves is not None:
+        moves.check_map(grid_height, grid_width)
+        if not moves.admits_table():
+            heuristic_table = None
+
+    # counters only when asked for, see SearchProbe
+    probe = None if stats is None else SearchProbe()
+    push, pop = (heappush, heappop) if probe is None else (probe.push, probe.pop)
+
+    # walls (or agents that never move) cut the goal off,
+    # no point searching the time axis
+    if not statically_reachable(start, goal, grid_height, grid_width, static_obstacles, occupancy):
+        if probe is not None:
+            probe.record(stats, (), 0)
+        print("returning no path")
+        return None, None
 
-    # shortest known paths cost from the start to current
-    g_score = {(start, current_time): 0}
-    # estimated cost from start to goal through current (g_score + heuristic)
-    f_score = {(start, current_time): heuristic(start, goal)}
+    # never look more than `horizon` steps ahead (default: as far as a shortest path can go)
+    if horizon is None:
+        horizon = default_horizon(grid_height, grid_width, occupancy, current_time, reservations)
+    horizon = min(horizon, MAX_STEPS)
+
+    width = grid_width
+    cells = grid_height * grid_width
+    stride = cells << TIME_BITS
+    # heap entries hold the state as is, or flip - state with cutoff, so
+    # among equal f the later (deeper) state sorts first
+    flip, sign = (stride - 1, -1) if cutoff else (0, 1)
+    blocked = flat_obstacle_mask(static_obstacles, grid_height, grid_width)
+    agent_cells = occupancy.indexed(grid_width)
+    if probe is not None:
+        # the agent lookup below is this engine's inline is_cell_free
+        agent_cells = probe.counted(agent_cells)
+    steps = (FOUR_CONNECTED if moves is None else moves).flat_moves(width)
+    costs = None if moves is None else moves.costs
+    diagonal_moves = moves is not None and moves.connectivity == 8
+    # plain moves: g is the step count, no table needed
+    g_score = None if moves is None else {}
+    goal_x, goal_y = goal
+    goal_cell = goal_x * width + goal_y
+    start_time = current_time
+    # agents repeat every `period` steps, so (time % period, cell) is the
+    # real state; a later visit with the same phase can't do any better.
+    # robot reservations (cooperative planning) aren't periodic, so until
+    # the last of them the exact state is the key, negated to keep them apart
+    period = occupancy.period
+    settle_time = -1 if reservations is None else reservations.settle_time
+    closed = set()
+
+    def estimate(x, y):
+        if heuristic_table is not None:
+            return heuristic_table[x * width + y]
+        dx, dy = abs(x - goal_x), abs(y - goal_y)
+        return max(dx, dy) if diagonal_moves else dx + dy
+
+    open_set = []
+    came_from = {}
+    prefix = []
+    if 0 <= start[0] < grid_height and 0 <= start[1] < width:
+        start_state = start[0] * width + start[1]
+        came_from[start_state] = -1
+        if g_score is not None:
+            g_score[start_state] = 0
+        open_set.append(estimate(*start) * stride + flip + sign * start_state)
+    else:
+        # a start pushed off the map can't be encoded: take the first step
+        # by hand and put the start back in front of the path
+        prefix = [start]
+        for dx, dy, _, _ in steps:
+            nx, ny = start[0] + dx, start[1] + dy
+            if not (0 <= nx < grid_height and 0 <= ny < width) or blocked[nx * width + ny]:
+                continue
+            if occupancy.is_blocked((nx, ny), current_time + 1):
+                continue
+            if reservations is not None and not reservations.can_move(start, (nx, ny), current_time + 1):
+                continue
+            h = estimate(nx, ny)
+            if h < 0:
+                continue
+            state = cells + nx * width + ny
+            new_g = 1 if costs is None else costs[nx * width + ny]
+            came_from[state] = -1
+            if g_score is not None:
+                g_score[state] = new_g
+            push(open_set, (new_g + h) * stride + flip + sign * state)
+    # cutoff: deepest state expanded (closest to the goal among those) and the one ending the search
+    deepest = (0, 0, -1)
+    found = None
 
-    # expolre nodes till goal is reached
     while open_set:
-        # Get node with minimum f_score i.e., highest priority
-        score, current_time, current = heappop(open_set)
-
-        if current == goal:
-            # Reconstruct path
-            path = []
-            current_state = (current, current_time)
-            while current_state in came_from:
-                # add current position to path
-                path.append(current_state[0])
-                # move to previous position
-                current_state = came_from[current_state]
-            path.append(start)
-            return list(reversed(path)), current_time
-
-        # Check each neighbor
-        for next_pos in get_neighbors(current, grid_height, grid_width):
-            next_time = current_time + 1
-
-            # Skip if cell is obstaclt (static or dynamic)
-            if not is_cell_free(next_pos, next_time, static_obstacles, agents):
+        state = (pop(open_set) % stride - flip) * sign
+        step, cell = divmod(state, cells)
+
+        # lazy deletion of entries for already expanded states
+        time_step = start_time + step
+        closed_key = time_step % period * cells + cell if time_step > settle_time else -1 - state
+        if closed_key in closed:
+            continue
+        closed.add(closed_key)
+
+        # with reservations we may only stop on the goal if nobody passes later
+        if cell == goal_cell and (reservations is None or reservations.can_park(goal, time_step)):
+            found = state
+            break
+
+        if step >= horizon:
+            if cutoff:
+                # the window's edge; everything after it is the estimate
+                found = state
+                break
+            continue
+
+        x, y = divmod(cell, width)
+        if cutoff and (step, -estimate(x, y)) > deepest[:2]:
+            deepest = (step, -estimate(x, y), state)
+        g = step if g_score is None else g_score[state]
+        next_step = step + 1
+        next_time = start_time + next_step
+        base = next_step * cells
+        closed_base = next_time % period * cells if next_time > settle_time else -1 - base
+
+        # right, down, left, up, then the diagonals and waiting if allowed
+        for dx, dy, delta, diagonal in steps:
+            nx, ny = x + dx, y + dy
+            if not (0 <= nx < grid_height and 0 <= ny < width):
+                continue
+            next_cell = cell + delta
+            if blocked[next_cell]:
+                continue
+            # no squeezing diagonally between two walls' corners
+            if diagonal and (blocked[cell + dx * width] or blocked[cell + dy]):
+                continue
+            entries = agent_cells.get(next_cell)
+            if entries is not None and any(next_time % p == phase for p, phase in entries):
+                continue
+
+            next_state = base + next_cell
+            if g_score is None:
+                # g only depends on time, so the first parent found is as good as any
+                if next_state in came_from:
+                    continue
+                new_g = next_step
+            else:
+                new_g = g + (1 if costs is None else costs[next_cell])
+                if new_g >= g_score.get(next_state, new_g + 1):
+                    continue
+            if (closed_base + next_cell if next_time > settle_time else closed_base - next_cell) in closed:
                 continue
+            # or another robot already reserved it (or is swapping with us)
+            if reservations is not None and not reservations.can_move((x, y), (nx, ny), next_time):
+                continue
+            if heuristic_table is None:
+                h = max(abs(nx - goal_x), abs(ny - goal_y)) if diagonal_moves else abs(nx - goal_x) + abs(ny - goal_y)
+            else:
+                h = heuristic_table[next_cell]
+                # the goal can't be reached from here at all
+                if h < 0:
+                    continue
+            if g_score is not None:
+                g_score[next_state] = new_g
+            came_from[next_state] = state
+            push(open_set, (new_g + h) * stride + flip + sign * next_state)
+
+    if probe is not None:
+        probe.record(stats, closed, max(came_from, default=0) // cells)
+        if cutoff:
+            merge_stats(stats, {'window_cutoffs': int(found is None or found % cells != goal_cell)})
+    if found is None and cutoff:
+        found = deepest[2]
+    if found is None or found < 0:
+        print("returning no path")
+        return None, None  # No path found
+    state = found
+    path = []
+    while state != -1:
+        path.append(divmod(state % cells, width))
+        state = came_from[state]
+    return prefix + path[::-1], start_time + found // cells
+
+
+# steps either side of a blocked cell that repair_path searches again first
+REPAIR_MARGIN = 8
+
+
+def first_blocked_step(path, current_time, occupancy, begin=1):
+    """Index of the first cell an agent is on when we get there, or None.
+
+    path[0] is where we are at current_time and path[k] is reached at
+    current_time + k; cells before `begin` aren't checked.
+    """
+    is_blocked = occupancy.is_blocked
+    for k in range(max(begin, 1), len(path)):
+        if is_blocked(path[k], current_time + k):
+            return k
+    return None
+
+
+def repair_path(path, grid_height, grid_width, static_obstacles, agents, current_time, occupancy,
+                stats=None, margin=REPAIR_MARGIN):
+    """Make a path that only avoids walls safe from the agents as well.
 
-            # compute cost of moving to this neighbor
-            tentative_g_score = g_score[(current, current_time)] + 1
-            next_state = (next_pos, next_time)
-
-            # Update if new path is better than previous path for this neighbor
-            if next_state not in g_score or tentative_g_score < g_score[next_state]:
-                # Update path
-                came_from[next_state] = (current, current_time)
-                # Update cost to reach this neighbor from start
-                g_score[next_state] = tentative_g_score
-                # Update estimated cost to reach goal using this path
-                f_score[next_state] = tentative_g_score + heuristic(next_pos, goal)
-                # Add this node to unexplored nodes
-                heappush(open_set, (f_score[next_state], next_time, next_pos))
-
-    print("returning no path")
-    return None, None  # No path found
\ No newline at end of file
+    Every step an agent blocks is replaced by a time-aware
+    a_star_search_array from `margin` cells before it to `margin` cells
+    after it, widened until that works; the rest of the path is left alone,
+    so the time axis is only searched where agents actually get in the way.
+    Returns the new path, or None when even the whole path can't be fixed.
+    """
+    path = list(path)
+    begin = 1
+    while True:
+        blocked = first_blocked_step(path, current_time, occupancy, begin)
+        if blocked is None:
+            return path
+        window = margin
+        while True:
+            first, last = max(0, blocked - window), min(len(path) - 1, blocked + window)
+            detour, _ = a_star_search_array(path[first], path[last], grid_height, grid_width, static_obstacles,
+                                            agents, current_time + first, occupancy,
+                                            horizon=4 * (last - first) + margin, stats=stats)
+            if detour:
+                break
+            if first == 0 and last == len(path) - 1:
+                return None
+            window *= 2
+        path[first:last + 1] = detour
+        # the detour is safe as searched, carry on after it
+        begin = first + len(detour)
@@ -0,0 +1,101 @@
+# Hassan Imrman
+# 22I-0813
+# Section E
+
+# terminal rendering of the grid
+# the frame lives in one numpy byte buffer laid out like the old
+# display_grid_with_obstacles output ("X . A R" plus a newline per row).
+# walls are drawn once; every tick only the cells agents and robots were on
+# last frame and are on now get touched, and the frame (or with ansi=True
+# just the cells that changed, as cursor moves) goes out in one write
+
+import sys
+import numpy as np
+from grid import AgentOccupancy, flat_obstacle_mask
+
+FREE, OBSTACLE, AGENT, ROBOT = ord('.'), ord('X'), ord('A'), ord('R')
+
+
+class GridRenderer:
+    """Draws frames of the grid from a character buffer.
+
+    draw(positions, timestamp) takes the robots' cells (a list of tuples or
+    an (n, 2) array) and writes the frame to out, a binary stream (stdout
+    by default). With ansi=True only the first frame is written whole,
+    later ones are the changed cells as cursor moves, which for a big map
+    is a tiny fraction of the frame.
+    """
+
+    def __init__(self, grid_height, grid_width, static_obstacles, agents=None, occupancy=None, out=None,
+                 ansi=False):
+        if occupancy is None:
+            occupancy = AgentOccupancy(agents or {})
+        self.grid_height = grid_height
+        self.grid_width = grid_width
+        self.out = out
+        self.ansi = ansi
+
+        self.blocked = np.frombuffer(flat_obstacle_mask(static_obstacles, grid_height, grid_width),
+                                     dtype=np.uint8).astype(bool)
+        self.buffer = np.full((grid_height, 2 * grid_width + 1), ord(' '), dtype=np.uint8)
+        self.buffer[:, -1] = ord('\n')
+        # the cell characters, every other byte of each line
+        self.cells = self.buffer[:, 0:2 * grid_width:2]
+        self.base = np.where(self.blocked, OBSTACLE, FREE).astype(np.uint8)
+        self.cells[...] = self.base.reshape(grid_height, grid_width)
+
+        # agent entries as flat cell, period, phase; walls win over agents
+        table = occupancy.to_array().astype(np.int64)
+        inside = (table[:, 0] >= 0) & (table[:, 0] < grid_height) & (table[:, 1] >= 0) & (table[:, 1] < grid_width)
+        table = table[inside]
+        flat = table[:, 0] * grid_width + table[:, 1]
+        keep = ~self.blocked[flat]
+        self.agent_cells, self.agent_period, self.agent_phase = flat[keep], table[keep, 2], table[keep, 3]
+
+        # cells drawn as agent or robot last frame
+        self.marked = np.zeros(0, dtype=np.int64)
+        self.frames = 0
+
+    def update(self, positions, timestamp):
+        """Bring the buffer to this tick; returns the flat cells whose character changed."""
+        width = self.grid_width
+        agents = self.agent_cells[timestamp % self.agent_period == self.agent_phase]
+
+        positions = np.asarray(positions, dtype=np.int64).reshape(-1, 2)
+        inside = ((positions[:, 0] >= 0) & (positions[:, 0] < self.grid_height)
+                  & (positions[:, 1] >= 0) & (positions[:, 1] < width))
+        robots = positions[inside, 0] * width + positions[inside, 1]
+        # same priority as before: wall, then agent, then robot
+        robots = robots[~self.blocked[robots]]
+
+        touched = np.union1d(self.marked, np.union1d(agents, robots))
+        rows, cols = np.divmod(touched, width)
+        before = self.cells[rows, cols].copy()
+        self.cells[self.marked // width, self.marked % width] = self.base[self.marked]
+        self.cells[robots // width, robots % width] = ROBOT
+        self.cells[agents // width, agents % width] = AGENT
+        self.marked = np.union1d(agents, robots)
+        return touched[self.cells[rows, cols] != before]
+
+    def frame(self):
+        """The whole frame as bytes."""
+        return self.buffer.tobytes()
+
+    def draw(self, positions, timestamp):
+        changed = self.update(positions, timestamp)
+        if not self.ansi:
+            data = self.frame()
+        elif self.frames == 0:
+            # clear the screen and put the cursor top left first
+            data = b'\x1b[2J\x1b[H' + self.frame()
+        else:
+            rows, cols = np.divmod(changed, self.grid_width)
+            chars = self.cells[rows, cols]
+            data = ''.join(f'\x1b[{row + 1};{2 * col + 1}H{chr(char)}'
+                           for row, col, char in zip(rows.tolist(), cols.tolist(), chars.tolist())).encode()
+            data += f'\x1b[{self.grid_height + 1};1H'.encode()
+        out = sys.stdout.buffer if self.out is None else self.out
+        out.write(data)
+        out.flush()
+        self.frames += 1
+        return len(data)
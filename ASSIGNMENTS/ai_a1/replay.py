@@ -0,0 +1,228 @@
+# Hassan Imrman
+# 22I-0813
+# Section E
+
+# binary replay logs of a run
+# the simulation loops hand every tick's robot positions to a ReplayWriter.
+# a tick is stored as one byte per robot (its step, each axis -2..2 since a
+# move plus a shove can add up), with a keyframe of absolute int32 positions
+# every KEYFRAME_EVERY ticks, so a replay can jump to any tick by reading one
+# keyframe and summing the steps after it. replaying never plans anything,
+# it only feeds positions to a GridRenderer and the collision checks
+#
+#   python replay.py run.rpl                       play it back headless
+#   python replay.py run.rpl --start 500 --render Data/data0.txt --agents Data/Agent0.txt
+#                                                   jump to tick 500 and draw it
+
+import argparse
+import json
+import struct
+import time
+import numpy as np
+from fleet import cell_keys
+
+# header: magic, height, width, robots, ticks, keyframes, keyframe index offset
+REPLAY_HEADER = struct.Struct('<4sIIIIIQ')
+REPLAY_MAGIC = b'RPLY'
+KEYFRAME_EVERY = 256
+
+# record kinds, the first byte of every tick
+KEYFRAME, STEPS = b'K', b'S'
+# step byte = (dx + 2) * 5 + (dy + 2)
+STEP_LIMIT = 2
+
+
+class ReplayWriter:
+    """Streams per-tick robot positions to a replay file.
+
+    record(positions) appends one tick ((n, 2) array or list of cells);
+    close() writes the keyframe index and the final header. Also a
+    context manager.
+    """
+
+    def __init__(self, file_path, grid_height, grid_width, robot_count, keyframe_every=KEYFRAME_EVERY):
+        self.file = open(file_path, 'wb')
+        self.grid_height = grid_height
+        self.grid_width = grid_width
+        self.robot_count = robot_count
+        self.keyframe_every = keyframe_every
+        self.ticks = 0
+        self.last = None
+        self.keyframes = []   # (tick, file offset)
+        self.file.write(REPLAY_HEADER.pack(REPLAY_MAGIC, grid_height, grid_width, robot_count, 0, 0, 0))
+
+    def record(self, positions):
+        # a copy: the fleet moves its position array in place
+        positions = np.array(positions, dtype=np.int64).reshape(self.robot_count, 2)
+        steps = None if self.last is None else positions - self.last
+        if (steps is None or self.ticks % self.keyframe_every == 0
+                or (len(steps) and np.abs(steps).max() > STEP_LIMIT)):
+            # first tick, regular keyframe, or a jump too big for a step byte
+            self.keyframes.append((self.ticks, self.file.tell()))
+            self.file.write(KEYFRAME)
+            self.file.write(positions.astype(np.int32).tobytes())
+        else:
+            codes = (steps[:, 0] + STEP_LIMIT) * (2 * STEP_LIMIT + 1) + steps[:, 1] + STEP_LIMIT
+            self.file.write(STEPS)
+            self.file.write(codes.astype(np.uint8).tobytes())
+        self.last = positions
+        self.ticks += 1
+
+    def close(self):
+        if self.file.closed:
+            return
+        index_offset = self.file.tell()
+        self.file.write(np.array(self.keyframes, dtype=np.int64).reshape(-1, 2).tobytes())
+        self.file.seek(0)
+        self.file.write(REPLAY_HEADER.pack(REPLAY_MAGIC, self.grid_height, self.grid_width, self.robot_count,
+                                           self.ticks, len(self.keyframes), index_offset))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Replay:
+    """A replay file, memory-mapped.
+
+    positions_at(tick) decodes one tick from the nearest keyframe before
+    it; frames(start, stop) walks ticks in order one record at a time.
+    """
+
+    def __init__(self, file_path):
+        with open(file_path, 'rb') as file:
+            header = REPLAY_HEADER.unpack(file.read(REPLAY_HEADER.size))
+        magic, self.grid_height, self.grid_width, self.robot_count, self.ticks, keyframes, index_offset = header
+        if magic != REPLAY_MAGIC:
+            raise ValueError(f'{file_path} is not a replay file')
+        self.data = np.memmap(file_path, dtype=np.uint8, mode='r')
+        index = self.data[index_offset:index_offset + 16 * keyframes].view(np.int64).reshape(-1, 2)
+        self.key_ticks, self.key_offsets = index[:, 0], index[:, 1]
+
+    def __len__(self):
+        return self.ticks
+
+    def _keyframe(self, k):
+        offset = int(self.key_offsets[k]) + 1
+        cells = self.data[offset:offset + 8 * self.robot_count].view(np.int32).reshape(-1, 2)
+        return cells.astype(np.int64)
+
+    def _steps(self, k, first, count):
+        """(count, n, 2) steps of ticks first.. after keyframe k."""
+        n = self.robot_count
+        offset = int(self.key_offsets[k]) + 1 + 8 * n + (first - int(self.key_ticks[k]) - 1) * (n + 1)
+        records = self.data[offset:offset + count * (n + 1)].reshape(count, n + 1)[:, 1:]
+        codes = records.astype(np.int64)
+        return np.stack((codes // (2 * STEP_LIMIT + 1), codes % (2 * STEP_LIMIT + 1)), axis=2) - STEP_LIMIT
+
+    def positions_at(self, tick):
+        """(n, 2) robot positions at the end of tick."""
+        if not 0 <= tick < self.ticks:
+            raise IndexError(f'tick {tick} not in replay of {self.ticks} ticks')
+        k = int(np.searchsorted(self.key_ticks, tick, side='right')) - 1
+        positions = self._keyframe(k)
+        after = tick - int(self.key_ticks[k])
+        if after:
+            positions = positions + self._steps(k, int(self.key_ticks[k]) + 1, after).sum(axis=0)
+        return positions
+
+    def frames(self, start=0, stop=None):
+        """(tick, positions) for every tick from start to stop (exclusive)."""
+        stop = self.ticks if stop is None else min(stop, self.ticks)
+        if start >= stop:
+            return
+        positions = self.positions_at(start)
+        yield start, positions
+        k = int(np.searchsorted(self.key_ticks, start, side='right')) - 1
+        for tick in range(start + 1, stop):
+            if k + 1 < len(self.key_ticks) and self.key_ticks[k + 1] == tick:
+                k += 1
+                positions = self._keyframe(k)
+            else:
+                positions = positions + self._steps(k, tick, 1)[0]
+            yield tick, positions
+
+
+def detect_collisions(positions, previous=None):
+    """Robots sharing a cell and, given last tick's positions, robots that swapped.
+
+    Same (vertex, swaps) arrays as CollisionIndex.detect, worked out from
+    positions alone, so a shove that trades two robots' cells counts as a
+    swap here too.
+    """
+    keys = cell_keys(positions)
+    order = np.argsort(keys, kind='stable')
+    ordered = keys[order]
+    same = ordered[1:] == ordered[:-1]
+    shared = np.zeros(len(keys), dtype=bool)
+    shared[1:] |= same
+    shared[:-1] |= same
+    vertex = order[shared]
+    if previous is None:
+        return vertex, np.zeros((0, 2), dtype=np.int64)
+
+    # a swap: my new cell is your old cell and your new cell is mine
+    before = cell_keys(previous)
+    moved = np.flatnonzero(before != keys)
+    lookup = dict(zip(before[moved].tolist(), moved.tolist()))
+    pairs = set()
+    for index, key in zip(moved.tolist(), keys[moved].tolist()):
+        other = lookup.get(key)
+        if other is not None and other != index and keys[other] == before[index]:
+            pairs.add((min(index, other), max(index, other)))
+    return vertex, np.array(sorted(pairs), dtype=np.int64).reshape(-1, 2)
+
+
+def play(replay, start=0, stop=None, renderer=None, collisions=True):
+    """Fast-forward through a replay, drawing and/or checking collisions.
+
+    Returns timings: seconds spent decoding, drawing and collision checking,
+    and the conflicts found.
+    """
+    timings = {'ticks': 0, 'decode_seconds': 0.0, 'render_seconds': 0.0, 'collision_seconds': 0.0,
+               'vertex_conflicts': 0, 'swaps': 0}
+    previous = None
+    clock = time.perf_counter()
+    for tick, positions in replay.frames(start, stop):
+        now = time.perf_counter()
+        timings['decode_seconds'] += now - clock
+        if renderer is not None:
+            renderer.draw(positions, tick)
+            timings['render_seconds'] += time.perf_counter() - now
+            now = time.perf_counter()
+        if collisions:
+            vertex, swaps = detect_collisions(positions, previous)
+            timings['vertex_conflicts'] += len(vertex)
+            timings['swaps'] += len(swaps)
+            timings['collision_seconds'] += time.perf_counter() - now
+        previous = positions
+        timings['ticks'] += 1
+        clock = time.perf_counter()
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Play back a replay log without planning and print timings.')
+    parser.add_argument('replay')
+    parser.add_argument('--start', type=int, default=0, help='first tick to play')
+    parser.add_argument('--stop', type=int, default=None, help='tick to stop before')
+    parser.add_argument('--render', metavar='MAP', help='draw the run on this map file (agents from --agents)')
+    parser.add_argument('--agents', help='agent file drawn with --render')
+    parser.add_argument('--no-collisions', action='store_true', help='skip the collision checks')
+    args = parser.parse_args()
+
+    replay = Replay(args.replay)
+    renderer = None
+    if args.render:
+        from grid import read_and_initialize_obstacles
+        from agent import read_agents
+        from render import GridRenderer
+        grid_height, grid_width, static_obstacles = read_and_initialize_obstacles(args.render)
+        agents = read_agents(args.agents) if args.agents else {}
+        renderer = GridRenderer(grid_height, grid_width, static_obstacles, agents, ansi=True)
+    timings = play(replay, args.start, args.stop, renderer, not args.no_collisions)
+    summary = dict(timings, replay=args.replay, robots=replay.robot_count, total_ticks=len(replay))
+    print(json.dumps(summary, indent=2))
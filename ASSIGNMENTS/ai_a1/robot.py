@@ -4,15 +4,114 @@
 
 
 import random
-from pathfinding import a_star_search
+from collections.abc import Sequence
+from itertools import islice
+from pathfinding import a_star_search, a_star_search_array, goal_distances, merge_stats, repair_path, static_path
+from sipp import sipp_search
+from hpa import hpa_search
+from jps import jps_search
+from rolling import rolling_search
 from collision import get_random_direction
-from grid import is_cell_free
+from grid import is_cell_free, AgentOccupancy
+
+# planners Robot.plan_path can use, all take the a_star_search arguments
+PLANNERS = {
+    'astar': a_star_search,
+    'array': a_star_search_array,
+    'sipp': sipp_search,
+    'hpa': hpa_search,
+    'jps': jps_search,
+    'rolling': rolling_search,
+}
+
+class PathLog:
+    """save_path kept as runs of equal steps instead of one tuple per step.
+
+    Straight stretches (and waiting in place) become a single (dx, dy, count)
+    run. Supports append/extend like the list it replaces, and iterating
+    gives back every cell.
+    """
+
+    def __init__(self, start):
+        self.start = start
+        self.last = start
+        self.runs = []
+        self.length = 1
+
+    def append(self, cell):
+        dx, dy = cell[0] - self.last[0], cell[1] - self.last[1]
+        if self.runs and self.runs[-1][0] == dx and self.runs[-1][1] == dy:
+            self.runs[-1][2] += 1
+        else:
+            self.runs.append([dx, dy, 1])
+        self.last = cell
+        self.length += 1
+
+    def extend(self, cells):
+        for cell in cells:
+            self.append(cell)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        x, y = self.start
+        yield (x, y)
+        for dx, dy, count in self.runs:
+            for _ in range(count):
+                x += dx
+                y += dy
+                yield (x, y)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class PathView(Sequence):
+    """Read-only view of the cells of a planned path from a cursor on.
+
+    Reading it costs nothing, however long the path; there is no append or
+    item assignment, a new path is set by assigning robot.path.
+    """
+
+    __slots__ = ('cells', 'start')
+
+    def __init__(self, cells, start=0):
+        self.cells = cells
+        self.start = start
+
+    def __len__(self):
+        return len(self.cells) - self.start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.cells[self.start:][index]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('path index out of range')
+        return self.cells[self.start + index]
+
+    def __iter__(self):
+        return islice(self.cells, self.start, None)
+
+    def __eq__(self, other):
+        return isinstance(other, Sequence) and len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self):
+        return repr(list(self))
+
 
 class Robot:
-    def __init__(self, start, goal, static_obstacles,grid_width,grid_height,agents):
+    def __init__(self, start, goal, static_obstacles,grid_width,grid_height,agents, planner='astar', incremental=True, compress_history=False, rng=None, moves=None, occupancy=None):
 
-        while not is_cell_free(start,0,static_obstacles,agents):
-            start = (random.randint(0, grid_width - 1), random.randint(0, grid_height - 1))
+        # every random choice of this robot (new start, collision shoves)
+        # comes from rng, a random.Random; pass a seeded one (shared by the
+        # fleet is fine) for repeatable runs
+        self.rng = random if rng is None else rng
+        # pass the fleet's AgentOccupancy, scanning every agent per robot is slow
+        while not is_cell_free(start,0,static_obstacles,agents,occupancy):
+            start = (self.rng.randint(0, grid_height - 1), self.rng.randint(0, grid_width - 1))
             print("New start  " , start)
             
         self.start = start
@@ -20,33 +119,106 @@ class Robot:
         self.current = start
         self.path = []
         self.total_time = 0
-        self.save_path = [start]  
+        # run-length save_path for long runs, a plain list otherwise
+        self.save_path = PathLog(start) if compress_history else [start]
         self.collision_count = 0
         self.noPath = False
+        self.planner = planner
+        # after a collision repair the static shortest path from our goal
+        # table (see replan) instead of planning from scratch
+        self.incremental = incremental
+        # set by collision.CollisionIndex to hear about our moves
+        self.collision_index = None
+        self.collision_slot = None
+        # search counters summed over every plan, set to {} to collect them;
+        # stats_sink is an extra dict (shared by the whole fleet) the
+        # simulation loop empties every tick
+        self.stats = None
+        self.stats_sink = None
+        # steps planned ahead when no horizon is given (rolling horizon robots)
+        self.window = None
+        # pathfinding.MoveModel (waits, diagonals, terrain); None is the
+        # plain 4-connected model. only the A* planners take one
+        self.moves = moves
+        # our goal_distances table and the map it is for, see goal_table
+        self.distances = None
+        self.distances_map = None
 
 
-    def handle_collision(self, grid_height, grid_width, static_obstacles, agents, current_time, direction):
+    def handle_collision(self, grid_height, grid_width, static_obstacles, agents, current_time, direction, occupancy=None):
         # random direction and replan path
         self.collision_count += 1
+        old = self.current
         self.current = (self.current[0]+direction[0],self.current[1]+direction[1])
+        if self.collision_index is not None:
+            self.collision_index.update(self.collision_slot, old, self.current, moving=False)
         print("Collision! Changing Direction!")
         self.path = [] #reset path
-        #plan the path again
-        success = self.plan_path(grid_height, grid_width, static_obstacles, agents, current_time)
+        #plan the path again (the static table only knows the plain moves)
+        if self.incremental and self.moves is None:
+            success = self.replan(grid_height, grid_width, static_obstacles, agents, current_time, occupancy)
+        else:
+            success = self.plan_path(grid_height, grid_width, static_obstacles, agents, current_time, occupancy)
         if not success:
             print(f'Robot at {self.current} failed to find new path after collision')
             
         return success
 
+    def replan(self, grid_height, grid_width, static_obstacles, agents, current_time, occupancy=None):
+        # the shove only moved us, the walls are the same: walk our goal
+        # table downhill for the static shortest path, then repair_path
+        # searches the time axis again only around the steps agents block.
+        # a repaired path can be a few steps longer than a fresh search
+        # (incremental=False always plans from scratch)
+        if self.goal in static_obstacles:
+            self.path = []
+            self.noPath = True
+            return False
+
+        distances = self.goal_table(grid_height, grid_width, static_obstacles)
+        path = static_path(self.current, distances, grid_height, grid_width)
+        if self.stats is not None:
+            self.add_stats({'replans': 1})
+
+        if path:
+            if occupancy is None:
+                occupancy = AgentOccupancy(agents)
+            search_stats = None if self.stats is None else {}
+            path = repair_path(path, grid_height, grid_width, static_obstacles, agents, current_time, occupancy,
+                               search_stats)
+            if self.stats is not None:
+                self.add_stats(search_stats)
+            if path:
+                self.path = path[1:]
+                self.total_time = current_time + len(path) - 1
+                return True
+
+        return self.plan_path(grid_height, grid_width, static_obstacles, agents, current_time, occupancy)
+
+    # the planned path is an immutable tuple plus a cursor, so following it
+    # is O(1) per step; `path` reads as a read-only view of what's left and
+    # assigns like the old list
+    @property
+    def path(self):
+        return PathView(self._path, self.path_index)
+
+    @path.setter
+    def path(self, cells):
+        self._path = tuple(cells)
+        self.path_index = 0
+
     def move(self):
-        if self.path and not self.is_done():
-            next_pos = self.path.pop(0)
+        if self.path_index < len(self._path) and not self.is_done():
+            next_pos = self._path[self.path_index]
+            self.path_index += 1
+            if self.collision_index is not None:
+                self.collision_index.update(self.collision_slot, self.current, next_pos)
             self.current = next_pos
             self.save_path.append(next_pos)
             return True
         return False
 
-    def plan_path(self, grid_height, grid_width, static_obstacles, agents, current_time):
+    def plan_path(self, grid_height, grid_width, static_obstacles, agents, current_time, occupancy=None, horizon=None, planner=None, reservations=None):
 
 
         if self.goal in static_obstacles:
@@ -54,16 +226,38 @@ class Robot:
             self.noPath = True
             return False
         
-        # Plan path using A* algorithm
-        path, total_time = a_star_search(
+        # Plan path using A* (or whichever planner was picked)
+        search = PLANNERS[planner or self.planner]
+        if horizon is None:
+            horizon = self.window
+
+        # exact distances to our goal, kept so replans don't redo the BFS;
+        # hpa* and jps are there to avoid that whole-map BFS
+        distances = None if search in (hpa_search, jps_search) else self.goal_table(grid_height, grid_width, static_obstacles)
+
+        # only the A* engines know about other robots' reservations and move models
+        extra = {} if reservations is None else {'reservations': reservations}
+        if self.moves is not None:
+            if search not in (a_star_search, a_star_search_array, rolling_search):
+                raise ValueError(f'planner {planner or self.planner} only has the plain moves')
+            extra['moves'] = self.moves
+        if self.stats is not None:
+            extra['stats'] = search_stats = {}
+        path, total_time = search(
             self.current,
             self.goal,
             grid_height,
             grid_width,
             static_obstacles,
             agents,
-            current_time
+            current_time,
+            occupancy,
+            horizon,
+            distances,
+            **extra
         )
+        if self.stats is not None:
+            self.add_stats(search_stats)
         
         if path:
             self.path = path[1:]  # Exclude current position
@@ -75,9 +269,24 @@ class Robot:
             self.noPath = True
             return False
 
+    def goal_table(self, grid_height, grid_width, static_obstacles):
+        # the robot keeps its own table: goal_distances' LRU only holds a few
+        # dozen goals, and a fleet with more than that replanning in turn
+        # would rebuild the whole-map BFS on every replan
+        if self.distances is None or self.distances_map is not static_obstacles:
+            self.distances = goal_distances(self.goal, grid_height, grid_width, static_obstacles)
+            self.distances_map = static_obstacles
+        return self.distances
+
+    def add_stats(self, stats):
+        merge_stats(self.stats, stats)
+        if self.stats_sink is not None:
+            merge_stats(self.stats_sink, stats)
+
     def is_done(self):
-        # reached goal or no path
-        return self.current == self.goal or self.noPath == True
+        # reached goal or no path; a planned path may pass the goal and come
+        # back to it later (waiting out a reservation), so only the end counts
+        return (self.current == self.goal and self.path_index >= len(self._path)) or self.noPath == True
 
     def display_path_and_time(self):
         if self.noPath:
@@ -0,0 +1,73 @@
+# Hassan Imrman
+# 22I-0813
+# Section E
+
+# rolling horizon planning for long trips
+# a robot only plans its next `window` steps with the agents taken into
+# account; past the window the cached goal_distances table (walls only)
+# stands in for the rest of the trip. it plans again every few ticks, long
+# before it runs out of planned steps, so a search never looks further than
+# the window ahead however big the map is. the fleet's replans are spread
+# over the ticks so every tick replans about the same number of robots
+
+from pathfinding import a_star_search_array, goal_distances
+
+# steps planned with agents in view, and how often (in ticks) robots replan
+ROLLING_WINDOW = 32
+
+
+def replan_every(window=None):
+    """Ticks between two replans of the same robot: half its window."""
+    return max(1, (window or ROLLING_WINDOW) // 2)
+
+
+def rolling_search(start, goal, grid_height, grid_width, static_obstacles, agents, current_time, occupancy=None,
+                   horizon=None, heuristic_table=None, reservations=None, stats=None, moves=None):
+    """a_star_search_array looking only `horizon` steps ahead (ROLLING_WINDOW by default).
+
+    Inside the window every step is checked against the agents (and
+    reservations); a state at the edge of the window is scored as horizon
+    plus its static distance to the goal, from heuristic_table or the
+    cached goal_distances. Robots pass their own table, so a replan costs
+    the window, not a walk over the map. See a_star_search_array's cutoff
+    for what comes back.
+    """
+    if horizon is None:
+        horizon = ROLLING_WINDOW
+    if heuristic_table is None:
+        heuristic_table = goal_distances(goal, grid_height, grid_width, static_obstacles)
+    return a_star_search_array(start, goal, grid_height, grid_width, static_obstacles, agents, current_time,
+                               occupancy, horizon, heuristic_table, reservations, stats, moves, cutoff=True)
+
+
+def due_for_replan(robots, current_time, window=None, done=None):
+    """Indices of the robots that replan at current_time.
+
+    Robot i replans every replan_every(window) ticks, shifted by i so the
+    fleet's replans are spread evenly over the ticks, and straight away if
+    it has used up its planned steps. done overrides robot.is_done() (the
+    Fleet keeps its own flags).
+    """
+    every = replan_every(window)
+    return [index for index, robot in enumerate(robots)
+            if not (robot.is_done() if done is None else done[index])
+            and ((current_time + index) % every == 0 or robot.total_time <= current_time)]
+
+
+def plan_rolling(robots, grid_height, grid_width, static_obstacles, agents, current_time, occupancy=None,
+                 window=None, indices=None):
+    """Plan the next window of robots[i] for i in indices (default: all of them).
+
+    The robots are switched to rolling_search for good, so replans after a
+    collision are windowed too.
+    """
+    window = window or ROLLING_WINDOW
+    for index in range(len(robots)) if indices is None else indices:
+        robot = robots[index]
+        if robot.is_done():
+            continue
+        robot.planner = 'rolling'
+        robot.window = window
+        robot.incremental = False
+        robot.path = []
+        robot.plan_path(grid_height, grid_width, static_obstacles, agents, current_time, occupancy)
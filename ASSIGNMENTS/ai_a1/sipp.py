@@ -0,0 +1,169 @@
+# Hassan Imrman
+# 22I-0813
+# Section E
+
+# Safe Interval Path Planning
+# instead of one state per (cell, time) we keep one state per (cell, safe interval)
+# a safe interval is a maximal run of time steps where no agent is on the cell
+# robots may wait inside an interval, so paths can repeat a cell
+
+import math
+import weakref
+from bisect import bisect_left
+from heapq import heappush, heappop
+from grid import AgentOccupancy, statically_reachable
+from pathfinding import heuristic, table_heuristic, default_horizon, SearchProbe
+
+INFINITY = float('inf')
+
+
+class SafeIntervals:
+    """Per-cell safe intervals derived from the periodic agent schedules.
+
+    For every cell an agent visits we precompute the cell's own cycle (lcm of
+    the periods touching it) and the sorted blocked times inside one cycle.
+    Any absolute time can then be mapped to its interval with one bisect.
+    """
+
+    _cache = weakref.WeakKeyDictionary()
+
+    def __init__(self, occupancy):
+        self.cells = {}
+        for cell, entries in occupancy.cells.items():
+            cycle = math.lcm(*{period for period, _ in entries})
+            blocked = sorted({t for period, phase in entries for t in range(phase, cycle, period)})
+            self.cells[cell] = (cycle, blocked)
+
+    @classmethod
+    def for_occupancy(cls, occupancy):
+        # built once per occupancy index and reused by every search
+        intervals = cls._cache.get(occupancy)
+        if intervals is None:
+            intervals = cls._cache[occupancy] = cls(occupancy)
+        return intervals
+
+    def interval(self, cell, time_step):
+        """(start, end) of the safe interval holding time_step, end exclusive.
+
+        Returns None when the cell is blocked at time_step. Cells no agent
+        visits have a single interval (0, inf).
+        """
+        info = self.cells.get(cell)
+        if info is None:
+            return 0, INFINITY
+        cycle, blocked = info
+        if len(blocked) == cycle:
+            return None
+        base, phase = time_step - time_step % cycle, time_step % cycle
+        k = bisect_left(blocked, phase)
+        if k < len(blocked) and blocked[k] == phase:
+            return None
+        start = base + blocked[k - 1] + 1 if k > 0 else base - cycle + blocked[-1] + 1
+        end = base + blocked[k] if k < len(blocked) else base + cycle + blocked[0]
+        return start, end
+
+
+def sipp_search(start, goal, grid_height, grid_width, static_obstacles, agents, current_time, occupancy=None, horizon=None, heuristic_table=None, stats=None):
+    if occupancy is None:
+        occupancy = AgentOccupancy(agents)
+
+    probe = None if stats is None else SearchProbe()
+    push, pop = (heappush, heappop) if probe is None else (probe.push, probe.pop)
+
+    if not statically_reachable(start, goal, grid_height, grid_width, static_obstacles, occupancy):
+        if probe is not None:
+            probe.record(stats, (), 0)
+        print("returning no path")
+        return None, None
+
+    if horizon is None:
+        horizon = default_horizon(grid_height, grid_width, occupancy, current_time)
+    max_time = current_time + horizon
+    intervals = SafeIntervals.for_occupancy(occupancy)
+    # the agents repeat every `period` steps, so an interval one period later
+    # is the same state reached later; key states on the phase like a_star_search
+    period = occupancy.period
+    estimate = heuristic if heuristic_table is None else table_heuristic(heuristic_table, grid_width)
+
+    # an agent standing on the start only means we have to leave right away
+    start_interval = intervals.interval(start, current_time) or (current_time, current_time + 1)
+    start_state = (start, start_interval[0] % period)
+
+    # (f_score, arrival time, position, interval start)
+    open_set = [(current_time + heuristic(start, goal), current_time, start, start_state[1])]
+    # earliest arrival per state and where we came from
+    arrival = {start_state: current_time}
+    came_from = {}
+    closed = set()
+
+    def push_first_interval(parent, next_pos, next_time, latest_arrival):
+        # push the first safe interval of next_pos we can reach in time; later
+        # ones are deferred behind a marker entry so we never list them all
+        h = estimate(next_pos, goal)
+        if h < 0:
+            return
+        while next_time <= latest_arrival:
+            next_interval = intervals.interval(next_pos, next_time)
+            if next_interval is None:
+                next_time += 1
+                continue
+            next_state = (next_pos, next_interval[0] % period)
+            if next_state not in closed and next_time < arrival.get(next_state, INFINITY):
+                arrival[next_state] = next_time
+                came_from[next_state] = parent
+                push(open_set, (next_time + h, next_time, next_pos, next_state[1]))
+            next_time = next_interval[1] + 1
+            if next_time <= latest_arrival:
+                push(open_set, (next_time + h, next_time, next_pos, -1,
+                                    (parent, latest_arrival)))
+            return
+
+    while open_set:
+        entry = pop(open_set)
+        score, time_step, current, interval_start = entry[:4]
+
+        # deferred marker: generate the next interval of `current` for its parent
+        if interval_start == -1:
+            parent, latest_arrival = entry[4]
+            push_first_interval(parent, current, time_step, latest_arrival)
+            continue
+
+        state = (current, interval_start)
+        if state in closed:
+            continue
+        closed.add(state)
+
+        if current == goal:
+            if probe is not None:
+                probe.record(stats, closed, max(arrival.values()) - current_time)
+            return _reconstruct(state, arrival, came_from), time_step
+
+        # we can wait here until the interval ends, then we must have moved
+        end = intervals.interval(current, time_step)
+        end = end[1] if end is not None else time_step + 1
+        latest_arrival = min(end, max_time, time_step + period)
+
+        for dx, dy in ((0, 1), (1, 0), (0, -1), (-1, 0)):
+            next_pos = (current[0] + dx, current[1] + dy)
+            if not (0 <= next_pos[0] < grid_height and 0 <= next_pos[1] < grid_width):
+                continue
+            if next_pos in static_obstacles:
+                continue
+            push_first_interval(state, next_pos, time_step + 1, latest_arrival)
+
+    if probe is not None:
+        probe.record(stats, closed, max(arrival.values()) - current_time)
+    print("returning no path")
+    return None, None
+
+
+def _reconstruct(state, arrival, came_from):
+    # expand waits so path[k] is the position at start time + k
+    path = []
+    while state in came_from:
+        parent = came_from[state]
+        path.append(state[0])
+        path.extend([parent[0]] * (arrival[state] - arrival[parent] - 1))
+        state = parent
+    path.append(state[0])
+    return list(reversed(path))